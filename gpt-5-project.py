@@ -1,3 +1,79 @@
+@@ FILE: doudizhu/base.py @@
+from__future__ import annotations
+from typing import Dict, List, Optional, Tuple
+
+RANKS: List[str] = ["3","4","5","6","7","8","9","T","J","Q","K","A","2","B","R"]
+SUITS: List[str] = ["Club", "Diamond", "Heart", "Spade"]
+NUM_CARDS: int = 54
+
+class Card:
+    # Cards are interned: ids 0..51 are the suited cards (rank-major, suits
+    # in SUITS order), 52/53 the jokers, and 54.. the suitless placeholders
+    # for ranks "3".."2". Card(rank, suit) returns the shared instance, so
+    # equality is identity and copying returns the same object.
+    __slots__ = ("id", "rank", "suit", "rank_index", "order")
+
+    def __new__(cls, rank: str, suit: Optional[str] = None) -> "Card":
+        card = CARD_BY_KEY.get((rank, suit))
+        if card is None:
+            raise ValueError("Unknown card: rank=%r suit=%r" % (rank, suit))
+        return card
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("Card is immutable")
+
+    def __delattr__(self, name) -> None:
+        raise AttributeError("Card is immutable")
+
+    def __copy__(self) -> "Card":
+        return self
+
+    def __deepcopy__(self, memo) -> "Card":
+        return self
+
+    def __reduce__(self):
+        return (CardFromId, (self.id,))
+
+    def __hash__(self) -> int:
+        return self.id
+
+    def __repr__(self) -> str:
+        return "Card(rank=%r, suit=%r)" % (self.rank, self.suit)
+
+def MakeInternedCard(card_id: int, rank: str, suit: Optional[str]) -> Card:
+    card = object.__new__(Card)
+    rank_index = RANKS.index(rank)
+    object.__setattr__(card, "id", card_id)
+    object.__setattr__(card, "rank", rank)
+    object.__setattr__(card, "suit", suit)
+    object.__setattr__(card, "rank_index", rank_index)
+    # Matches the (rank, suit or "") order hands are sorted by.
+    object.__setattr__(card, "order", rank_index * (len(SUITS) + 1) + (0 if suit is None else SUITS.index(suit) + 1))
+    return card
+
+def BuildInternedCards() -> Tuple[Card, ...]:
+    cards: List[Card] = []
+    for rank in RANKS[:13]:
+        for suit in SUITS:
+            cards.append(MakeInternedCard(len(cards), rank, suit))
+    cards.append(MakeInternedCard(len(cards), "B", None))
+    cards.append(MakeInternedCard(len(cards), "R", None))
+    for rank in RANKS[:13]:
+        cards.append(MakeInternedCard(len(cards), rank, None))
+    return tuple(cards)
+
+CARD_BY_KEY: Dict[Tuple[str, Optional[str]], Card] = {}
+CARDS: Tuple[Card, ...] = BuildInternedCards()
+for _card in CARDS:
+    CARD_BY_KEY[(_card.rank, _card.suit)] = _card
+del _card
+
+def CardFromId(card_id: int) -> Card:
+    return CARDS[card_id]
+
+Deck = List[Card]
+Hand = List[Card]
+PlayAction = List[Card]
 @@ FILE: doudizhu/Judger.py @@
 from__future__ import annotations
 from typing import List, Dict, Sequence
@@ -9,13 +85,19 @@ class Judger:
 
     def IsGameOver(self, players: Sequence[Player]) -> bool:
         for p in players:
-            if len(p.GetHand()) == 0:
+            if p.HandSize() == 0:
+                return True
+        return False
+
+    def IsGameOverBySizes(self, hand_sizes: Sequence[int]) -> bool:
+        for size in hand_sizes:
+            if size == 0:
                 return True
         return False
 
     def GetWinner(self, players: Sequence[Player]) -> int:
         for p in players:
-            if len(p.GetHand()) == 0:
+            if p.HandSize() == 0:
                 return p.GetId()
         return -1
 
@@ -38,7 +120,7 @@ def NewJudger() -> Judger:
 @@ FILE: doudizhu/Dealer.py @@
 from__future__ import annotations
 import random
-from typing import List, Tuple, Sequence, Dict
+from typing import List, Optional, Tuple, Sequence, Dict
 from doudizhu.base import Card, Deck, Hand
 
 def CreateFullDeck() -> Deck:
@@ -56,6 +138,29 @@ def CreateFullDeck() -> Deck:
 class Dealer:
     def __init__(self) -> None:
         self.deck: Deck = []
+        self.seed: Optional[int] = None
+        self.deal_index: int = 0
+        self.rng: Optional[random.Random] = None
+        self.use_global_random: bool = False
+
+    def Reseed(self, seed: Optional[int]) -> None:
+        # A seeded dealer's shuffles are defined purely by the deal index: the
+        # stream is DealAt(0), DealAt(1), ... and has no other RNG state. An
+        # unseeded dealer owns a Random seeded from entropy, or shares the
+        # module-level random state when use_global_random is set.
+        self.seed = seed
+        self.deal_index = 0
+        if seed is not None:
+            self.rng = None
+        elif self.use_global_random:
+            self.rng = random  # type: ignore
+        else:
+            self.rng = random.Random()
+
+    def DealRng(self, deal_index: int) -> random.Random:
+        if self.seed is None:
+            raise ValueError("Indexed deals need a seeded dealer; use NewDealer(seed=...) or Reseed")
+        return random.Random(str(self.seed) + ":" + str(deal_index))
 
     @staticmethod
     def EvaluateHandHeuristic(hand_str: str) -> int:
@@ -93,11 +198,18 @@ class Dealer:
                 score = score + 40
         return score
 
-    def ShuffleDeck(self) -> Deck:
+    def ShuffleDeck(self, rng=None) -> Deck:
+        # Without an rng, a seeded dealer shuffles the next deal of its stream.
+        if rng is None:
+            if self.seed is None:
+                rng = self.rng
+            else:
+                rng = self.DealRng(self.deal_index)
+                self.deal_index = self.deal_index + 1
         deck_to_shuffle = list(self.deck)
         n = len(deck_to_shuffle)
         for i in range(n - 1, 0, -1):
-            j = random.randint(0, i)
+            j = rng.randint(0, i)
             temp = deck_to_shuffle[i]
             deck_to_shuffle[i] = deck_to_shuffle[j]
             deck_to_shuffle[j] = temp
@@ -113,6 +225,12 @@ class Dealer:
             seen_cards.append(deck[i])
         return (hands, seen_cards)
 
+    def DealAt(self, deal_index: int) -> Tuple[List[Hand], Hand]:
+        return self.Deal(self.ShuffleDeck(self.DealRng(deal_index)))
+
+    def NextDeal(self) -> Tuple[List[Hand], Hand]:
+        return self.Deal(self.ShuffleDeck())
+
     def DetermineLandlord(self, players: Sequence) -> int:
         best_score = float("-inf")
         landlord_id = 0
@@ -124,29 +242,39 @@ class Dealer:
                 landlord_id = player.GetId()
         return landlord_id
 
-def NewDealer() -> Dealer:
+def NewDealer(seed: Optional[int] = None, use_global_random: bool = False) -> Dealer:
     dealer_instance = Dealer()
     dealer_instance.deck = CreateFullDeck()
+    dealer_instance.use_global_random = use_global_random
+    dealer_instance.Reseed(seed)
     return dealer_instance
 @@ FILE: doudizhu/Player.py @@
-from typing import List, Dict, Any, Optional, Sequence
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 import copy
-from doudizhu.base import Card, Hand, PlayAction
+from doudizhu.base import NUM_CARDS, Card, Hand, PlayAction
+
+RANK_ORDER: List[str] = ["3","4","5","6","7","8","9","T","J","Q","K","A","2","B","R"]
+RANK_TO_INDEX: Dict[str, int] = {r: i for i, r in enumerate(RANK_ORDER)}
 
 class Player:
     def __init__(self) -> None:
         self.id: int = 0
         self.hand: Hand = []
         self.role: str = "peasant"
+        self.hand_str_cache: Optional[str] = None
+        self.hand_view_cache: Optional[Tuple[Card, ...]] = None
+        self.hand_str_rebuilds: int = 0
+        self.hand_str_reuses: int = 0
 
     @staticmethod
     def CardsEqual(a: Card, b: Card) -> bool:
-        return (a.rank == b.rank) and ((a.suit == b.suit) or (a.suit is None) or (b.suit is None))
+        if a.id == b.id:
+            return True
+        return (a.rank_index == b.rank_index) and ((a.id >= NUM_CARDS) or (b.id >= NUM_CARDS))
 
     @staticmethod
     def SortHand(player: 'Player') -> None:
-        order_map: Dict[str, int] = {"3":0,"4":1,"5":2,"6":3,"7":4,"8":5,"9":6,"T":7,"J":8,"Q":9,"K":10,"A":11,"2":12,"B":13,"R":14}
-        player.hand.sort(key=lambda card: (order_map[card.rank], (card.suit or "")))
+        player.hand.sort(key=lambda card: card.order)
 
     def ParseActionStringToCards(self, action_str: str) -> PlayAction:
         result: PlayAction = []
@@ -161,7 +289,7 @@ class Player:
         for ch in action_str:
             if (ch in rank_to_indices) and (len(rank_to_indices[ch]) > 0):
                 idx = rank_to_indices[ch].pop()
-                result.append(copy.copy(self.hand[idx]))
+                result.append(self.hand[idx])
             else:
                 result.append(Card(rank=ch, suit=None))
         return result
@@ -175,7 +303,36 @@ class Player:
     def GetRole(self) -> str:
         return self.role
 
+    def GetRankCounts(self) -> List[int]:
+        counts = [0] * len(RANK_ORDER)
+        for card in self.hand:
+            counts[card.rank_index] += 1
+        return counts
+
     def GetHandAsString(self) -> str:
+        if self.hand_str_cache is not None:
+            self.hand_str_reuses = self.hand_str_reuses + 1
+            return self.hand_str_cache
+        self.hand_str_rebuilds = self.hand_str_rebuilds + 1
+        self.hand_str_cache = self.BuildHandString()
+        return self.hand_str_cache
+
+    def InvalidateHandCache(self) -> None:
+        self.hand_str_cache = None
+        self.hand_view_cache = None
+
+    def GetHandView(self) -> Tuple[Card, ...]:
+        if self.hand_view_cache is None:
+            self.hand_view_cache = tuple(self.hand)
+        return self.hand_view_cache
+
+    def HandSize(self) -> int:
+        return len(self.hand)
+
+    def HandStringCacheStats(self) -> Dict[str, int]:
+        return {"rebuilds": self.hand_str_rebuilds, "reuses": self.hand_str_reuses}
+
+    def BuildHandString(self) -> str:
         rank_order = ["3","4","5","6","7","8","9","T","J","Q","K","A","2","B","R"]
         bucket: Dict[str, int] = {r: 0 for r in rank_order}
         for card in self.hand:
@@ -198,6 +355,7 @@ def NewPlayer(id: int) -> Player:
 class Player(Player):  # Extend with remaining methods under the same class name per constraints
     def SetHand(self, hand: Hand) -> None:
         self.hand = copy.copy(hand)
+        self.InvalidateHandCache()
 
     def SetRole(self, role: str) -> None:
         self.role = role
@@ -206,18 +364,46 @@ class Player(Player):  # Extend with remaining methods under the same class name
         for card in cards:
             self.hand.append(card)
         Player.SortHand(self)
+        self.InvalidateHandCache()
 
     def RemoveCards(self, cards: PlayAction) -> None:
+        self.RemoveCardsUndoable(cards)
+
+    def IsHandSorted(self) -> bool:
+        for i in range(1, len(self.hand)):
+            if self.hand[i - 1].order > self.hand[i].order:
+                return False
+        return True
+
+    def RemoveCardsUndoable(self, cards: PlayAction) -> Tuple[List[Tuple[int, Card]], Optional[Hand]]:
+        # Returns (removed positions, hand before sorting). Removing from a sorted hand keeps it
+        # sorted, so the pre-sort copy is only needed the first time an unsorted hand is played from.
+        presort: Optional[Hand] = None
+        if not self.IsHandSorted():
+            presort = list(self.hand)
+        removed_at: List[Tuple[int, Card]] = []
         for played_card in cards:
             removed = False
             for i in range(0, len(self.hand)):
                 if Player.CardsEqual(self.hand[i], played_card):
+                    removed_at.append((i, self.hand[i]))
                     del self.hand[i]
                     removed = True
                     break
             if not removed:
                 print("Warning: attempted to remove card not in hand for player", self.id)
         Player.SortHand(self)
+        self.InvalidateHandCache()
+        return (removed_at, presort)
+
+    def UndoRemoveCards(self, token: Tuple[List[Tuple[int, Card]], Optional[Hand]]) -> None:
+        removed_at, presort = token
+        if presort is not None:
+            self.hand = presort
+        else:
+            for i, card in reversed(removed_at):
+                self.hand.insert(i, card)
+        self.InvalidateHandCache()
 
     def SelectAction(self, state: Dict) -> PlayAction:
         legal_action_strings: List[str] = state["actions"]
@@ -235,20 +421,182 @@ class Player(Player):  # Extend with remaining methods under the same class name
             return []
         else:
             return self.ParseActionStringToCards(chosen_str)
+
+class CountHandPlayer(Player):
+    def __init__(self) -> None:
+        self.rank_counts: List[int] = [0] * len(RANK_ORDER)
+        self.suit_stacks: Optional[List[List[Card]]] = [[] for _ in RANK_ORDER]
+        self.hand_size: int = 0
+        super().__init__()
+
+    @property
+    def hand(self) -> Hand:
+        return self.GetHand()
+
+    @hand.setter
+    def hand(self, cards: Hand) -> None:
+        self.SetHand(cards)
+
+    def SetHand(self, hand: Hand) -> None:
+        self.InvalidateHandCache()
+        self.rank_counts = [0] * len(RANK_ORDER)
+        self.hand_size = 0
+        if self.suit_stacks is not None:
+            self.suit_stacks = [[] for _ in RANK_ORDER]
+        self.AddCards(hand)
+
+    def AddCards(self, cards: Hand) -> None:
+        self.InvalidateHandCache()
+        for card in cards:
+            i = card.rank_index
+            self.rank_counts[i] += 1
+            self.hand_size += 1
+            if self.suit_stacks is None:
+                continue
+            stack = self.suit_stacks[i]
+            pos = len(stack)
+            while pos > 0 and stack[pos - 1].order > card.order:
+                pos -= 1
+            stack.insert(pos, card)
+
+    def RemoveCards(self, cards: PlayAction) -> None:
+        self.RemoveCardsUndoable(cards)
+
+    def RemoveCardsUndoable(self, cards: PlayAction) -> List[Tuple[int, Optional[int], Card]]:
+        self.InvalidateHandCache()
+        removed_at: List[Tuple[int, Optional[int], Card]] = []
+        for played_card in cards:
+            i = played_card.rank_index
+            removed = False
+            if self.suit_stacks is None:
+                removed = self.rank_counts[i] > 0
+                if removed:
+                    removed_at.append((i, None, played_card))
+            else:
+                stack = self.suit_stacks[i]
+                for j in range(0, len(stack)):
+                    if Player.CardsEqual(stack[j], played_card):
+                        removed_at.append((i, j, stack[j]))
+                        del stack[j]
+                        removed = True
+                        break
+            if removed:
+                self.rank_counts[i] -= 1
+                self.hand_size -= 1
+            else:
+                print("Warning: attempted to remove card not in hand for player", self.id)
+        return removed_at
+
+    def UndoRemoveCards(self, token: List[Tuple[int, Optional[int], Card]]) -> None:
+        self.InvalidateHandCache()
+        for i, j, card in reversed(token):
+            self.rank_counts[i] += 1
+            self.hand_size += 1
+            if j is not None:
+                self.suit_stacks[i].insert(j, card)
+
+    def GetHand(self) -> Hand:
+        hand: Hand = []
+        if self.suit_stacks is None:
+            for i in range(0, len(RANK_ORDER)):
+                for _ in range(0, self.rank_counts[i]):
+                    hand.append(Card(rank=RANK_ORDER[i], suit=None))
+            return hand
+        for stack in self.suit_stacks:
+            hand.extend(stack)
+        return hand
+
+    def GetRankCounts(self) -> List[int]:
+        return list(self.rank_counts)
+
+    def HandSize(self) -> int:
+        return self.hand_size
+
+    def BuildHandString(self) -> str:
+        result = ""
+        for i in range(0, len(RANK_ORDER)):
+            result = result + RANK_ORDER[i] * self.rank_counts[i]
+        return result
+
+    def ParseActionStringToCards(self, action_str: str) -> PlayAction:
+        result: PlayAction = []
+        if action_str == "pass":
+            return result
+        taken = [0] * len(RANK_ORDER)
+        for ch in action_str:
+            i = RANK_TO_INDEX.get(ch)
+            if (i is not None) and (self.suit_stacks is not None) and (taken[i] < len(self.suit_stacks[i])):
+                taken[i] += 1
+                result.append(self.suit_stacks[i][-taken[i]])
+            else:
+                result.append(Card(rank=ch, suit=None))
+        return result
+
+def NewCountHandPlayer(id: int, track_suits: bool = True) -> CountHandPlayer:
+    player_instance = CountHandPlayer()
+    player_instance.id = id
+    if not track_suits:
+        player_instance.suit_stacks = None
+    player_instance.SetHand([])
+    player_instance.role = "peasant"
+    return player_instance
 @@ FILE: doudizhu/Round.py @@
 from__future__ import annotations
-from typing import List, Tuple, Optional, Sequence
-from doudizhu.base import Card, PlayAction
+from collections.abc import Sequence as SequenceABC
+from typing import Any, Callable, Dict, List, Mapping, Tuple, Optional, Sequence
+from doudizhu.base import RANKS, Card, PlayAction
 from doudizhu.Player import Player
 
+class ActionTraceView(SequenceABC):
+    # Read-only prefix of a round's action trace. The round only appends to
+    # its trace list, so a view just remembers the list and its length at the
+    # time it was taken; every view of a round shares the same storage. An
+    # undo that would drop entries a view still covers copies the list first.
+    __slots__ = ("items", "length")
+
+    def __init__(self, items: List[Tuple[int, str]], length: int) -> None:
+        self.items = items
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.items[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index = index + self.length
+        if index < 0 or index >= self.length:
+            raise IndexError("action trace index out of range")
+        return self.items[index]
+
+    def __iter__(self):
+        for i in range(0, self.length):
+            yield self.items[i]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (ActionTraceView, list, tuple)):
+            return NotImplemented
+        return len(other) == self.length and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return "ActionTraceView(%r)" % (list(self),)
+
 class Round:
     def __init__(self) -> None:
         self.players: Sequence[Player] = []
         self.judger = None
         self.action_trace: List[Tuple[int, str]] = []
         self.played_cards: List[Card] = []
+        self.played_counts: List[int] = [0] * len(RANKS)
+        self.played_str_cache: Optional[str] = None
         self.last_non_pass_player: Optional[int] = None
         self.consecutive_passes: int = 0
+        self.last_valid_play: Optional[Tuple[int, str]] = None
+        self.last_valid_info: Optional[Mapping[str, Any]] = None
+        self.trace_shared_len: int = 0
+        self.successors: Dict[int, int] = {}
+        self.first_seat: Optional[int] = None
 
     @staticmethod
     def ActionToString(action: PlayAction) -> str:
@@ -258,13 +606,15 @@ class Round:
         return s
 
     def GetLastValidPlay(self) -> Optional[Tuple[int, str]]:
-        if self.last_non_pass_player is None:
+        return self.last_valid_play
+
+    def GetLastValidPattern(self, identify: Callable[[str], Mapping[str, Any]]) -> Optional[Mapping[str, Any]]:
+        # Pattern info of the last valid play, identified at most once per play.
+        if self.last_valid_play is None:
             return None
-        for i in range(len(self.action_trace) - 1, -1, -1):
-            player_id, action_str = self.action_trace[i]
-            if player_id == self.last_non_pass_player:
-                return (player_id, action_str)
-        return None
+        if self.last_valid_info is None:
+            self.last_valid_info = identify(self.last_valid_play[1])
+        return self.last_valid_info
 
     def RecordAction(self, player_id: int, action: PlayAction) -> None:
         if len(action) == 0:
@@ -275,44 +625,283 @@ class Round:
             self.action_trace.append((player_id, action_str))
             for c in action:
                 self.played_cards.append(c)
+                self.played_counts[c.rank_index] += 1
+            self.played_str_cache = None
             self.consecutive_passes = 0
             self.last_non_pass_player = player_id
+            self.last_valid_play = (player_id, action_str)
+            self.last_valid_info = None
         return
 
-    def GetNextPlayer(self, current_player_id: int) -> int:
-        n = len(self.players)
-        next_index = -1
+    def RecordActionUndoable(self, player_id: int, action: PlayAction) -> Tuple:
+        token = (len(self.action_trace), len(self.played_cards), self.last_non_pass_player,
+                 self.consecutive_passes, self.last_valid_play, self.last_valid_info)
+        self.RecordAction(player_id, action)
+        return token
+
+    def UndoAction(self, token: Tuple) -> None:
+        (trace_len, played_len, last_non_pass_player,
+         consecutive_passes, last_valid_play, last_valid_info) = token
+        if self.trace_shared_len > trace_len:
+            # A view still covers the entries being dropped: leave that list to the views.
+            self.action_trace = self.action_trace[:trace_len]
+            self.trace_shared_len = 0
+        else:
+            del self.action_trace[trace_len:]
+        for c in self.played_cards[played_len:]:
+            self.played_counts[c.rank_index] -= 1
+        del self.played_cards[played_len:]
+        self.played_str_cache = None
+        self.last_non_pass_player = last_non_pass_player
+        self.consecutive_passes = consecutive_passes
+        self.last_valid_play = last_valid_play
+        self.last_valid_info = last_valid_info
+
+    def LoadPosition(self, played_counts: Sequence[int], last_valid_play: Optional[Tuple[int, str]],
+                     consecutive_passes: int) -> None:
+        self.action_trace = []
+        self.trace_shared_len = 0
+        self.played_cards = []
+        self.played_counts = list(played_counts)
+        self.played_str_cache = None
+        self.last_valid_play = last_valid_play
+        self.last_valid_info = None
+        self.last_non_pass_player = None if last_valid_play is None else last_valid_play[0]
+        self.consecutive_passes = consecutive_passes
+
+    def SetSeatOrder(self, seat_order: Optional[Sequence[int]] = None,
+                     skipped_players: Optional[Sequence[int]] = None) -> None:
+        # Resolves the rotation once into a successor table. Seats default to the
+        # order of self.players; a skipped seat still maps to the next active one.
+        if seat_order is None:
+            seat_order = [p.GetId() for p in self.players]
+        skipped = set(skipped_players or ())
+        active = [pid for pid in seat_order if pid not in skipped]
+        self.successors = {}
+        self.first_seat = None
+        if not seat_order:
+            return
+        if not active:
+            raise ValueError("Seat order must leave at least one active player")
+        self.first_seat = active[0]
+        n = len(seat_order)
         for i in range(0, n):
-            if self.players[i].GetId() == current_player_id:
-                next_index = (i + 1) % n
-                break
-        if next_index == -1:
-            return self.players[0].GetId()
-        return self.players[next_index].GetId()
+            for step in range(1, n + 1):
+                candidate = seat_order[(i + step) % n]
+                if candidate not in skipped:
+                    self.successors[seat_order[i]] = candidate
+                    break
+
+    def Reset(self) -> None:
+        self.LoadPosition([0] * len(RANKS), None, 0)
+
+    def GetNextPlayer(self, current_player_id: int) -> int:
+        return self.successors.get(current_player_id, self.first_seat)
 
     def GetActionTrace(self) -> Sequence[Tuple[int, str]]:
-        return list(self.action_trace)
+        return self.GetActionTracePrefix(len(self.action_trace))
+
+    def GetActionTracePrefix(self, n: int) -> Sequence[Tuple[int, str]]:
+        n = max(0, min(n, len(self.action_trace)))
+        if n > self.trace_shared_len:
+            self.trace_shared_len = n
+        return ActionTraceView(self.action_trace, n)
 
     def GetAllPlayedCards(self) -> Sequence[str]:
-        ranks_list: List[str] = []
-        for c in self.played_cards:
-            ranks_list.append(c.rank)
-        order_map = {r: i for i, r in enumerate(self.judger.rank_order)}
-        ranks_list.sort(key=lambda ch: order_map[ch])
-        return ranks_list
-
-def NewRound(players: Sequence[Player], judger) -> Round:
+        return list(self.GetPlayedCardsAsString())
+
+    def GetPlayedCounts(self) -> Sequence[int]:
+        return tuple(self.played_counts)
+
+    def GetPlayedCardsAsString(self) -> str:
+        if self.played_str_cache is None:
+            self.played_str_cache = "".join(RANKS[i] * n for i, n in enumerate(self.played_counts))
+        return self.played_str_cache
+
+def NewRound(players: Sequence[Player], judger, seat_order: Optional[Sequence[int]] = None,
+             skipped_players: Optional[Sequence[int]] = None) -> Round:
     round_instance = Round()
     round_instance.players = players
     round_instance.judger = judger
     round_instance.action_trace = []
     round_instance.played_cards = []
+    round_instance.played_counts = [0] * len(RANKS)
+    round_instance.played_str_cache = None
     round_instance.last_non_pass_player = None
     round_instance.consecutive_passes = 0
+    round_instance.last_valid_play = None
+    round_instance.last_valid_info = None
+    round_instance.trace_shared_len = 0
+    round_instance.SetSeatOrder(seat_order, skipped_players)
     return round_instance
 @@ FILE: doudizhu/ActionGenerator.py @@
 from__future__ import annotations
-from typing import Any, Dict, List, Optional, Sequence
+import itertools
+import math
+import os
+import pickle
+import random
+import weakref
+from bisect import bisect_right
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+MAX_HAND_SIZE = 20
+ACTION_FAMILIES = ["solo", "pair", "trio", "trio_single", "trio_pair", "straight", "pair_chain", "airplane", "airplane_wings", "four_two", "bomb", "rocket"]
+RESPONSE_FAMILIES = {"solo": "solo", "pair": "pair", "trio": "trio", "trio_single": "trio_single", "trio_pair": "trio_pair", "straight": "straight", "pair_chain": "pair_chain", "airplane": "airplane", "airplane_single": "airplane_wings", "airplane_pair": "airplane_wings", "four_two_single": "four_two", "four_two_pair": "four_two"}
+PATTERN_SHAPE_FIELDS = {"trio_single": "core_count", "trio_pair": "core_count", "straight": "length", "pair_chain": "pair_len", "airplane": "trio_len", "airplane_single": "trio_len", "airplane_pair": "trio_len"}
+
+class ActionTable:
+    def __init__(self) -> None:
+        self.actions: List[str] = ["pass"]
+        self.action_to_id: Dict[str, int] = {"pass": 0}
+        self.families: List[str] = [""]
+        self.infos: List[Dict[str, Any]] = [{"kind": "invalid", "main_value": -1}]
+        self.requirements: List[Tuple[int, ...]] = [()]
+        self.row_ranks: List[Tuple[Tuple[int, int], ...]] = [()]
+        self.family_index: Dict[str, Dict[Tuple[Tuple[int, int], ...], List[int]]] = {f: {} for f in ACTION_FAMILIES}
+        self.pattern_index: Optional[Dict[str, Mapping[str, Any]]] = None
+        self.strength_index: Optional[Dict[Tuple[str, Any], Tuple[List[int], List[int]]]] = None
+        self.sort_keys: Optional[List[Tuple[int, int, Tuple[int, ...]]]] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state["pattern_index"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__()
+        self.__dict__.update(state)
+
+    @staticmethod
+    def SparseCounts(counts: Sequence[int]) -> Tuple[Tuple[int, int], ...]:
+        return tuple((i, c) for i, c in enumerate(counts) if c > 0)
+
+    @staticmethod
+    def Fits(sparse: Tuple[Tuple[int, int], ...], counts: Sequence[int]) -> bool:
+        for i, c in sparse:
+            if counts[i] < c:
+                return False
+        return True
+
+    def AddRow(self, action_str: str, family: str, info: Dict[str, Any], requirement: Sequence[int], core: Sequence[int]) -> int:
+        action_id = len(self.actions)
+        self.actions.append(action_str)
+        self.action_to_id[action_str] = action_id
+        self.families.append(family)
+        self.infos.append(info)
+        self.requirements.append(tuple(requirement))
+        self.row_ranks.append(ActionTable.SparseCounts(requirement))
+        self.family_index[family].setdefault(ActionTable.SparseCounts(core), []).append(action_id)
+        return action_id
+
+    def Size(self) -> int:
+        return len(self.actions)
+
+    def GetId(self, action_str: str) -> int:
+        return self.action_to_id.get(action_str, -1)
+
+    def GetAction(self, action_id: int) -> str:
+        return self.actions[action_id]
+
+    def GetInfo(self, action_id: int) -> Dict[str, Any]:
+        return self.infos[action_id]
+
+    def GetRequirement(self, action_id: int) -> Tuple[int, ...]:
+        return self.requirements[action_id]
+
+    @staticmethod
+    def PatternShape(info: Mapping[str, Any]) -> Tuple[str, Any]:
+        field = PATTERN_SHAPE_FIELDS.get(info["kind"])
+        if field is None:
+            return (info["kind"], None)
+        return (info["kind"], info.get(field))
+
+    def BuildStrengthIndex(self) -> None:
+        buckets: Dict[Tuple[str, Any], List[Tuple[int, int]]] = {}
+        for action_id in range(1, self.Size()):
+            info = self.infos[action_id]
+            if RESPONSE_FAMILIES.get(info["kind"]) != self.families[action_id]:
+                continue
+            buckets.setdefault(ActionTable.PatternShape(info), []).append((info["main_value"], action_id))
+        self.strength_index = {}
+        for shape, entries in buckets.items():
+            entries.sort()
+            self.strength_index[shape] = ([mv for mv, _ in entries], [action_id for _, action_id in entries])
+
+    def StrongerRows(self, last_info: Mapping[str, Any], counts: Sequence[int]) -> List[str]:
+        if self.strength_index is None:
+            self.BuildStrengthIndex()
+        bucket = self.strength_index.get(ActionTable.PatternShape(last_info))
+        out: List[str] = []
+        if bucket is None:
+            return out
+        values, row_ids = bucket
+        for pos in range(bisect_right(values, last_info["main_value"]), len(row_ids)):
+            action_id = row_ids[pos]
+            if ActionTable.Fits(self.row_ranks[action_id], counts):
+                out.append(self.actions[action_id])
+        return out
+
+    def FitRowIds(self, counts: Sequence[int]) -> List[int]:
+        out: List[int] = []
+        for family in ACTION_FAMILIES:
+            for core, row_ids in self.family_index[family].items():
+                if not ActionTable.Fits(core, counts):
+                    continue
+                for action_id in row_ids:
+                    if ActionTable.Fits(self.row_ranks[action_id], counts):
+                        out.append(action_id)
+        return out
+
+    def FitRows(self, family: str, counts: Sequence[int]) -> List[str]:
+        out: List[str] = []
+        for core, row_ids in self.family_index[family].items():
+            if not ActionTable.Fits(core, counts):
+                continue
+            for action_id in row_ids:
+                if ActionTable.Fits(self.row_ranks[action_id], counts):
+                    out.append(self.actions[action_id])
+        return out
+
+def SaveActionTable(table: ActionTable, path: str) -> None:
+    with open(path, "wb") as f:
+        pickle.dump(table, f)
+
+def LoadActionTable(path: str) -> ActionTable:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+class ActionCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def Get(self, key: Any) -> Optional[Tuple[str, ...]]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses = self.misses + 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits = self.hits + 1
+        return value
+
+    def Put(self, key: Any, value: Tuple[str, ...]) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    def Clear(self) -> None:
+        self.entries.clear()
+
+    def Stats(self) -> Dict[str, int]:
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
 
 class ActionGenerator:
     def __init__(self) -> None:
@@ -320,6 +909,15 @@ class ActionGenerator:
         self.RANK_TO_VAL: Dict[str, int] = {}
         self.MAX_STRAIGHT_RANK: str = ""
         self.MIN_STRAIGHT_RANK: str = ""
+        self.action_table: Optional[ActionTable] = None
+        self.pattern_lookup: Optional[Dict[str, Mapping[str, Any]]] = None
+        self.lead_cache: Optional[ActionCache] = None
+        self.response_cache: Optional[ActionCache] = None
+        self.skipped_attachments: int = 0
+        self.incremental_patterns: bool = False
+        self.verify_incremental: bool = False
+        # Keyed by the Player object, so tables sharing this generator keep separate state.
+        self.tracked_patterns: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
 
     def RankBefore(self, r: str) -> Optional[str]:
         idx = self.RANK_TO_VAL[r]
@@ -337,74 +935,61 @@ class ActionGenerator:
         val = self.RANK_TO_VAL[r]
         return (self.RANK_TO_VAL[self.MIN_STRAIGHT_RANK] <= val) and (val <= self.RANK_TO_VAL[self.MAX_STRAIGHT_RANK])
 
-    def CountRanks(self, hand_cards) -> Dict[str, int]:
-        m: Dict[str, int] = {}
+    def CountRanks(self, hand_cards) -> List[int]:
+        counts = [0] * len(self.RANK_ORDER)
         for c in hand_cards:
-            m[c.rank] = m.get(c.rank, 0) + 1
-        return m
+            counts[c.rank_index] += 1
+        return counts
 
-    def CountRanksFromString(self, s: str) -> Dict[str, int]:
-        m: Dict[str, int] = {}
+    def CountRanksFromString(self, s: str) -> List[int]:
+        counts = [0] * len(self.RANK_ORDER)
         for ch in s:
-            m[ch] = m.get(ch, 0) + 1
-        return m
+            counts[self.RANK_TO_VAL[ch]] += 1
+        return counts
 
-    def CloneCounts(self, m: Dict[str, int]) -> Dict[str, int]:
-        n: Dict[str, int] = {}
-        for k, v in m.items():
-            n[k] = v
-        return n
+    def CloneCounts(self, m: Sequence[int]) -> List[int]:
+        return list(m)
 
-    def SubCounts(self, a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
-        n = self.CloneCounts(a)
-        for k, v in b.items():
-            n[k] = n.get(k, 0) - v
-            if n[k] < 0:
-                n[k] = 0
-        return n
+    def SubCounts(self, a: Sequence[int], b: Sequence[int]) -> List[int]:
+        return [x - y if x > y else 0 for x, y in zip(a, b)]
 
-    def MakeUseMap(self, ranks: Sequence[str], times: int) -> Dict[str, int]:
-        m: Dict[str, int] = {}
+    def MakeUseMap(self, ranks: Sequence[str], times: int) -> List[int]:
+        m = [0] * len(self.RANK_ORDER)
         for r in ranks:
-            m[r] = m.get(r, 0) + times
+            m[self.RANK_TO_VAL[r]] += times
         return m
 
-    def CountTotal(self, m: Dict[str, int]) -> int:
-        s = 0
-        for _, c in m.items():
-            s = s + c
-        return s
+    def CountTotal(self, m: Sequence[int]) -> int:
+        return sum(m)
 
-    def NumberOfKeys(self, cnt: Dict[str, int]) -> int:
+    def NumberOfKeys(self, cnt: Sequence[int]) -> int:
         n = 0
-        for _, _ in cnt.items():
-            n = n + 1
+        for c in cnt:
+            if c > 0:
+                n = n + 1
         return n
 
-    def AllSameCount(self, cnt: Dict[str, int], value: int) -> bool:
-        if self.NumberOfKeys(cnt) == 0:
+    def AllSameCount(self, cnt: Sequence[int], value: int) -> bool:
+        return self.AllSameCountOver(cnt, cnt, value)
+
+    def AllSameCountOver(self, cnt: Sequence[int], keys: Sequence[int], value: int) -> bool:
+        if self.NumberOfKeys(keys) == 0:
             return False
-        for _, c in cnt.items():
-            if c != value:
+        for i in range(0, len(keys)):
+            if keys[i] > 0 and cnt[i] != value:
                 return False
         return True
 
-    def AllCountsMax(self, cnt: Dict[str, int], maxv: int) -> bool:
-        for _, c in cnt.items():
-            if c > maxv:
-                return False
-        return True
+    def AllCountsMax(self, cnt: Sequence[int], maxv: int) -> bool:
+        return max(cnt) <= maxv
 
-    def ContainsCount(self, cnt: Dict[str, int], target: int) -> bool:
-        for _, c in cnt.items():
-            if c == target:
-                return True
-        return False
+    def ContainsCount(self, cnt: Sequence[int], target: int) -> bool:
+        return target in cnt
 
-    def GetRankWithCount(self, cnt: Dict[str, int], target: int) -> Optional[str]:
-        for r, c in cnt.items():
-            if c == target:
-                return r
+    def GetRankWithCount(self, cnt: Sequence[int], target: int) -> Optional[str]:
+        for i in range(0, len(cnt)):
+            if cnt[i] == target:
+                return self.RANK_ORDER[i]
         return None
 
     def SortRanks(self, ranks: Sequence[str]) -> Sequence[str]:
@@ -412,11 +997,12 @@ class ActionGenerator:
         ranks.sort(key=lambda rank: self.RANK_TO_VAL[rank])
         return ranks
 
-    def SortedRanks(self, cnt: Dict[str, int]) -> Sequence[str]:
+    def SortedRanks(self, cnt: Sequence[int]) -> Sequence[str]:
         ranks: List[str] = []
-        for r, _ in cnt.items():
-            ranks.append(r)
-        return self.SortRanks(ranks)
+        for i in range(0, len(cnt)):
+            if cnt[i] > 0:
+                ranks.append(self.RANK_ORDER[i])
+        return ranks
 
     def IsConsecutive(self, ranks_sorted: Sequence[str]) -> bool:
         if len(ranks_sorted) <= 1:
@@ -432,55 +1018,59 @@ class ActionGenerator:
                 return False
         return True
 
-    def ListSingleRanksFromCounts(self, cnt: Dict[str, int]) -> Sequence[str]:
-        out: List[str] = []
-        for r, c in cnt.items():
-            for _ in range(1, c + 1):
-                out.append(r)
-        out = list(self.SortRanks(out))
-        return out
-
-    def ListPairRanksFromCounts(self, cnt: Dict[str, int]) -> Sequence[str]:
-        out: List[str] = []
-        for r, c in cnt.items():
-            k = c // 2
-            for _ in range(1, k + 1):
-                out.append(r)
-        out = list(self.SortRanks(out))
-        return out
-
-    def CombinationsByIndex(self, A: Sequence, k: int) -> Sequence[Sequence[int]]:
+    def EnumerateAttachments(self, remain: Sequence[int], limits: Sequence[int], slots: int, unit: int, exclude_rocket: bool) -> Tuple[List[List[int]], int]:
         result: List[List[int]] = []
-        cur: List[int] = []
-
-        def dfs(start: int, remain: int) -> None:
-            if remain == 0:
+        cur = [0] * len(limits)
+        room = [0] * (len(limits) + 1)
+        for i in range(len(limits) - 1, -1, -1):
+            room[i] = room[i + 1] + limits[i] // unit
+        b_val = self.RANK_TO_VAL["B"]
+        r_val = self.RANK_TO_VAL["R"]
+
+        def dfs(i: int, left: int) -> None:
+            if left == 0:
                 result.append(list(cur))
                 return
-            for i in range(start, len(A) - remain + 1):
-                cur.append(i)
-                dfs(i + 1, remain - 1)
-                cur.pop()
-
-        if k <= len(A) and k >= 0:
-            dfs(0, k)
-        return result
+            if room[i] < left:
+                return
+            most = min(limits[i] // unit, left)
+            if exclude_rocket and (i == r_val) and (cur[b_val] > 0):
+                most = 0
+            for m in range(0, most + 1):
+                cur[i] = m * unit
+                dfs(i + 1, left - m)
+            cur[i] = 0
+
+        if slots >= 0:
+            dfs(0, slots)
+        units = 0
+        for c in remain:
+            units = units + c // unit
+        skipped = math.comb(units, slots) - len(result) if 0 <= slots <= units else 0
+        return (result, skipped)
+
+    def AirplaneAttachmentLimits(self, core_ranks: Sequence[str], remain: Sequence[int]) -> List[int]:
+        limits = [min(c, 3) for c in remain]
+        for r in core_ranks:
+            limits[self.RANK_TO_VAL[r]] = 0
+        for edge in (self.RankBefore(core_ranks[0]), self.RankAfter(core_ranks[len(core_ranks) - 1])):
+            if (edge is not None) and self.IsRankInStraightRange(edge):
+                limits[self.RANK_TO_VAL[edge]] = min(limits[self.RANK_TO_VAL[edge]], 2)
+        return limits
 
-    def StringFromCounts(self, cnt: Dict[str, int]) -> str:
+    def StringFromCounts(self, cnt: Sequence[int]) -> str:
         s = ""
-        ranks_sorted = self.SortRanks(self.SortedRanks(cnt))
-        for r in ranks_sorted:
-            for _ in range(1, cnt.get(r, 0) + 1):
-                s = s + r
+        for i in range(0, len(cnt)):
+            s = s + self.RANK_ORDER[i] * cnt[i]
         return s
 
-    def FindAirplaneCores(self, counts: Dict[str, int]) -> Sequence[Sequence[str]]:
+    def FindAirplaneCores(self, counts: Sequence[int]) -> Sequence[Sequence[str]]:
         cores: List[List[str]] = []
         elig: List[str] = []
-        for r, c in counts.items():
-            if (c >= 3) and self.IsRankInStraightRange(r):
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if (counts[i] >= 3) and self.IsRankInStraightRange(r):
                 elig.append(r)
-        elig = list(self.SortRanks(elig))
         i = 0
         while i < len(elig):
             j = i
@@ -497,12 +1087,12 @@ class ActionGenerator:
             i = j + 1
         return cores
 
-    def TryExtractAirplaneCore(self, cnt: Dict[str, int]) -> Dict[str, Any]:
+    def TryExtractAirplaneCore(self, cnt: Sequence[int]) -> Dict[str, Any]:
         cores = self.FindAirplaneCores(cnt)
         for core_ranks in cores:
             ok = True
             for r in core_ranks:
-                if cnt.get(r, 0) < 3:
+                if cnt[self.RANK_TO_VAL[r]] < 3:
                     ok = False
                     break
             if ok:
@@ -517,49 +1107,86 @@ class ActionGenerator:
                 s = s + r
         return s
 
-    def IsValidAirplaneAttachmentCounts(self, core_ranks: Sequence[str], attach_cnt: Dict[str, int], attach_type: str) -> bool:
+    def IsValidAirplaneAttachmentCounts(self, core_ranks: Sequence[str], attach_cnt: Sequence[int], attach_type: str) -> bool:
         if attach_type == "single":
-            if (attach_cnt.get("B", 0) == 1) and (attach_cnt.get("R", 0) == 1):
+            if (attach_cnt[self.RANK_TO_VAL["B"]] == 1) and (attach_cnt[self.RANK_TO_VAL["R"]] == 1):
                 return False
-        total: Dict[str, int] = {}
+        total = list(attach_cnt)
         for r in core_ranks:
-            total[r] = total.get(r, 0) + 3
-        for r, c in attach_cnt.items():
-            total[r] = total.get(r, 0) + c
-        for _, c in total.items():
-            if c == 4:
-                return False
+            total[self.RANK_TO_VAL[r]] += 3
+        if 4 in total:
+            return False
         min_r = core_ranks[0]
         max_r = core_ranks[len(core_ranks) - 1]
         left_edge = self.RankBefore(min_r)
         if (left_edge is not None) and self.IsRankInStraightRange(left_edge):
-            if total.get(left_edge, 0) >= 3:
+            if total[self.RANK_TO_VAL[left_edge]] >= 3:
                 return False
         right_edge = self.RankAfter(max_r)
         if (right_edge is not None) and self.IsRankInStraightRange(right_edge):
-            if total.get(right_edge, 0) >= 3:
+            if total[self.RANK_TO_VAL[right_edge]] >= 3:
                 return False
         return True
 
-    def IsValidAirplaneAttachmentString(self, core_str: str, attach_cnt: Dict[str, int], attach_type: str) -> bool:
+    def IsValidAirplaneAttachmentString(self, core_str: str, attach_cnt: Sequence[int], attach_type: str) -> bool:
         core_rank_cnt = self.CountRanksFromString(core_str)
         core_ranks = self.SortedRanks(core_rank_cnt)
         return self.IsValidAirplaneAttachmentCounts(core_ranks, attach_cnt, attach_type)
 
-    def IdentifyPatternFromString(self, action_str: str) -> Dict[str, Any]:
+    def GetActionId(self, action_str: str) -> int:
+        table = self.action_table if self.action_table is not None else GetSharedActionTable(self)
+        action_id = table.GetId(action_str)
+        if action_id < 0:
+            action_id = table.GetId(self.NormalizeActionString(action_str))
+        return action_id
+
+    def NormalizeActionString(self, action_str: str) -> str:
+        return "".join(sorted(action_str, key=lambda ch: self.RANK_TO_VAL[ch]))
+
+    def BuildPatternIndex(self, table: ActionTable) -> Dict[str, Mapping[str, Any]]:
+        if table.pattern_index is None:
+            index: Dict[str, Mapping[str, Any]] = {}
+            for action_id in range(0, table.Size()):
+                action_str = table.actions[action_id]
+                record = MappingProxyType(dict(table.infos[action_id]))
+                index[action_str] = record
+                if action_id > 0:
+                    index.setdefault(self.NormalizeActionString(action_str), record)
+            table.pattern_index = index
+        return table.pattern_index
+
+    def CheckPatternLookup(self) -> Sequence[str]:
+        mismatched: List[str] = []
+        if self.pattern_lookup is None:
+            return mismatched
+        for key, record in self.pattern_lookup.items():
+            if self.IdentifyPatternFromStringSlow(key) != dict(record):
+                mismatched.append(key)
+        return mismatched
+
+    def IdentifyPatternFromString(self, action_str: str) -> Mapping[str, Any]:
+        if self.pattern_lookup is not None:
+            record = self.pattern_lookup.get(action_str)
+            if (record is None) and (action_str != ""):
+                record = self.pattern_lookup.get(self.NormalizeActionString(action_str))
+            if record is not None:
+                return record
+        return self.IdentifyPatternFromStringSlow(action_str)
+
+    def IdentifyPatternFromStringSlow(self, action_str: str) -> Dict[str, Any]:
         info: Dict[str, Any] = {"kind": "invalid", "main_value": -1}
         if action_str == "" or action_str == "pass":
             return info
         cnt = self.CountRanksFromString(action_str)
-        if (len(action_str) == 2) and (cnt.get("B", 0) == 1) and (cnt.get("R", 0) == 1):
+        if (len(action_str) == 2) and (cnt[self.RANK_TO_VAL["B"]] == 1) and (cnt[self.RANK_TO_VAL["R"]] == 1):
             info["kind"] = "rocket"
             info["main_value"] = 999
             return info
         if len(action_str) == 4:
-            for rank, c in cnt.items():
-                if c == 4:
+            for i in range(0, len(cnt)):
+                if cnt[i] == 4:
                     info["kind"] = "bomb"
-                    info["main_value"] = self.RANK_TO_VAL[rank]
+                    info["main_value"] = i
                     return info
         if len(action_str) == 1:
             r = action_str[0]
@@ -568,13 +1195,13 @@ class ActionGenerator:
             return info
         if len(action_str) == 2:
             if self.AllSameCount(cnt, 2) and (self.NumberOfKeys(cnt) == 1):
-                r = next(iter(cnt))
+                r = self.GetRankWithCount(cnt, 2)
                 info["kind"] = "pair"
                 info["main_value"] = self.RANK_TO_VAL[r]
                 return info
         if len(action_str) == 3:
             if self.AllSameCount(cnt, 3) and (self.NumberOfKeys(cnt) == 1):
-                r = next(iter(cnt))
+                r = self.GetRankWithCount(cnt, 3)
                 info["kind"] = "trio"
                 info["main_value"] = self.RANK_TO_VAL[r]
                 info["core_count"] = 1
@@ -601,9 +1228,10 @@ class ActionGenerator:
             if self.ContainsCount(cnt, 4):
                 four_rank = self.GetRankWithCount(cnt, 4)
                 rem_ranks: List[str] = []
-                for rank, c in cnt.items():
+                for i in range(0, len(cnt)):
+                    rank = self.RANK_ORDER[i]
                     if rank != four_rank:
-                        for _ in range(1, c + 1):
+                        for _ in range(1, cnt[i] + 1):
                             rem_ranks.append(rank)
                 if len(rem_ranks) == 2:
                     if not (("B" in rem_ranks) and ("R" in rem_ranks)):
@@ -615,8 +1243,9 @@ class ActionGenerator:
                 four_rank = self.GetRankWithCount(cnt, 4)
                 pairs_count = 0
                 ok = True
-                for rank, c in cnt.items():
-                    if rank == four_rank:
+                for i in range(0, len(cnt)):
+                    c = cnt[i]
+                    if c == 0 or self.RANK_ORDER[i] == four_rank:
                         continue
                     if c == 2:
                         pairs_count = pairs_count + 1
@@ -669,7 +1298,8 @@ class ActionGenerator:
                         info["core_count"] = k
                         return info
             if total_len == 5 * k:
-                if self.CountTotal(remain) == 2 * k and self.AllSameCount(remain, 2):
+                # remain keeps every rank of the action, core ranks included at zero
+                if self.CountTotal(remain) == 2 * k and self.AllSameCountOver(remain, cnt, 2):
                     airplane_cards_str = self.RepeatRanks(core_ranks, 3)
                     if self.IsValidAirplaneAttachmentString(airplane_cards_str, remain, "pair"):
                         info["kind"] = "airplane_pair"
@@ -679,232 +1309,204 @@ class ActionGenerator:
                         return info
         return info
 
-    def LexRankLess(self, a: str, b: str) -> bool:
-        i = 0
-        while (i < len(a)) and (i < len(b)):
-            va = self.RANK_TO_VAL[a[i]]
-            vb = self.RANK_TO_VAL[b[i]]
-            if va != vb:
-                return va < vb
-            i = i + 1
-        return len(a) < len(b)
-
     def SortUnique(self, seq: Sequence[str]) -> Sequence[str]:
         seen = set()
-        tmp: List[str] = []
+        keyed: List[Tuple[Tuple[int, int, Tuple[int, ...]], str]] = []
+        mixed = False
         for s in seq:
             if s not in seen:
                 seen.add(s)
-                tmp.append(s)
-        for i in range(1, len(tmp)):
-            j = i
-            while j > 0 and self.CompareActions(tmp[j], tmp[j - 1]):
-                tmp[j], tmp[j - 1] = tmp[j - 1], tmp[j]
-                j -= 1
-        return tmp
-
-    def CompareActions(self, a: str, b: str) -> bool:
-        if len(a) != len(b):
-            return len(a) < len(b)
-        ia = self.IdentifyPatternFromString(a)
-        ib = self.IdentifyPatternFromString(b)
-        if (ia["kind"] != "invalid") and (ib["kind"] != "invalid"):
-            if ia["main_value"] != ib["main_value"]:
-                return ia["main_value"] < ib["main_value"]
-            return self.LexRankLess(a, b)
-        else:
-            return self.LexRankLess(a, b)
+                key = self.ActionSortKey(s)
+                if (key[1] < 0) and (s != "pass"):
+                    mixed = True
+                keyed.append((key, s))
+        if not mixed:
+            keyed.sort()
+            return [s for _, s in keyed]
+        return self.SortMixedGroups(keyed)
+
+    def SortMixedGroups(self, keyed: List[Tuple[Tuple[int, int, Tuple[int, ...]], str]]) -> Sequence[str]:
+        # Unidentified strings compare by rank order only, so the pairwise order can cycle.
+        # A length group whose identified strings already follow rank order is sorted by it;
+        # any other group keeps the order a pairwise insertion sort on KeyLess produces.
+        groups: Dict[int, List[Tuple[Tuple[int, int, Tuple[int, ...]], str]]] = {}
+        for item in keyed:
+            groups.setdefault(item[0][0], []).append(item)
+        out: List[str] = []
+        for length in sorted(groups):
+            group = groups[length]
+            ranked = sorted(item[0] for item in group if item[0][1] >= 0)
+            if all(ranked[i][2] < ranked[i + 1][2] for i in range(0, len(ranked) - 1)):
+                group.sort(key=lambda item: item[0][2])
+            else:
+                for i in range(1, len(group)):
+                    j = i
+                    while j > 0 and self.KeyLess(group[j][0], group[j - 1][0]):
+                        group[j], group[j - 1] = group[j - 1], group[j]
+                        j -= 1
+            for _, s in group:
+                out.append(s)
+        return out
+
+    def ActionSortKey(self, a: str) -> Tuple[int, int, Tuple[int, ...]]:
+        if a == "pass":
+            return (len(a), -1, ())
+        vals = tuple(self.RANK_TO_VAL[ch] for ch in a)
+        info = self.IdentifyPatternFromString(a)
+        if info["kind"] == "invalid":
+            return (len(a), -1, vals)
+        return (len(a), info["main_value"], vals)
 
-    def FindSolos(self, hand_cards) -> Sequence[str]:
+    @staticmethod
+    def KeyLess(a: Tuple[int, int, Tuple[int, ...]], b: Tuple[int, int, Tuple[int, ...]]) -> bool:
+        if a[0] != b[0]:
+            return a[0] < b[0]
+        if (a[1] >= 0) and (b[1] >= 0) and (a[1] != b[1]):
+            return a[1] < b[1]
+        return a[2] < b[2]
+
+    def FindSolos(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("solo", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 1:
-                result.append(r)
+        for i in range(0, len(counts)):
+            if counts[i] >= 1:
+                result.append(self.RANK_ORDER[i])
         return self.SortUnique(result)
 
-    def FindPairs(self, hand_cards) -> Sequence[str]:
+    def FindPairs(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("pair", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 2 and r != "B" and r != "R":
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if counts[i] >= 2 and r != "B" and r != "R":
                 result.append(r + r)
         return self.SortUnique(result)
 
-    def FindTrios(self, hand_cards) -> Sequence[str]:
+    def FindTrios(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("trio", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 3 and r != "B" and r != "R":
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if counts[i] >= 3 and r != "B" and r != "R":
                 result.append(r + r + r)
         return self.SortUnique(result)
 
-    def FindTrioWithSingle(self, hand_cards) -> Sequence[str]:
+    def FindTrioWithSingle(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("trio_single", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 3 and r != "B" and r != "R":
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if counts[i] >= 3 and r != "B" and r != "R":
                 remain = self.CloneCounts(counts)
-                remain[r] = remain.get(r, 0) - 3
-                for s_rank, s_cnt in remain.items():
-                    if s_cnt >= 1 and s_rank != r:
-                        result.append(r + r + r + s_rank)
+                remain[i] -= 3
+                for j in range(0, len(remain)):
+                    if remain[j] >= 1 and j != i:
+                        result.append(r + r + r + self.RANK_ORDER[j])
         return self.SortUnique(result)
 
-    def FindTrioWithPair(self, hand_cards) -> Sequence[str]:
+    def FindTrioWithPair(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("trio_pair", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 3 and r != "B" and r != "R":
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if counts[i] >= 3 and r != "B" and r != "R":
                 remain = self.CloneCounts(counts)
-                remain[r] = remain.get(r, 0) - 3
-                for p_rank, p_cnt in remain.items():
-                    if (p_cnt >= 2) and (p_rank != "B") and (p_rank != "R") and (p_rank != r):
+                remain[i] -= 3
+                for j in range(0, len(remain)):
+                    p_rank = self.RANK_ORDER[j]
+                    if (remain[j] >= 2) and (p_rank != "B") and (p_rank != "R") and (j != i):
                         result.append(r + r + r + p_rank + p_rank)
         return self.SortUnique(result)
 
-    def FindStraights(self, hand_cards) -> Sequence[str]:
+    def FindChains(self, counts: Sequence[int], width: int, min_len: int) -> Sequence[str]:
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
         elig: List[str] = []
-        for r, c in counts.items():
-            if (c >= 1) and self.IsRankInStraightRange(r):
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if (counts[i] >= width) and self.IsRankInStraightRange(r):
                 elig.append(r)
-        elig = list(self.SortRanks(elig))
         i = 0
         while i < len(elig):
             j = i
             while (j + 1 < len(elig)) and (self.RANK_TO_VAL[elig[j + 1]] == self.RANK_TO_VAL[elig[j]] + 1):
                 j = j + 1
             block_len = j - i + 1
-            if block_len >= 5:
-                for L in range(5, block_len + 1):
+            if block_len >= min_len:
+                for L in range(min_len, block_len + 1):
                     for start in range(i, j - L + 2):
                         s = ""
                         for t in range(start, start + L):
-                            s = s + elig[t]
+                            s = s + elig[t] * width
                         result.append(s)
             i = j + 1
         return self.SortUnique(result)
 
-    def FindPairChains(self, hand_cards) -> Sequence[str]:
-        result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        elig: List[str] = []
-        for r, c in counts.items():
-            if (c >= 2) and self.IsRankInStraightRange(r):
-                elig.append(r)
-        elig = list(self.SortRanks(elig))
-        i = 0
-        while i < len(elig):
-            j = i
-            while (j + 1 < len(elig)) and (self.RANK_TO_VAL[elig[j + 1]] == self.RANK_TO_VAL[elig[j]] + 1):
-                j = j + 1
-            block_len = j - i + 1
-            if block_len >= 3:
-                for L in range(3, block_len + 1):
-                    for start in range(i, j - L + 2):
-                        s = ""
-                        for t in range(start, start + L):
-                            s = s + elig[t] + elig[t]
-                        result.append(s)
-            i = j + 1
-        return self.SortUnique(result)
+    def FindStraights(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("straight", counts))
+        return self.FindChains(counts, 1, 5)
 
-    def FindAirplanes(self, hand_cards) -> Sequence[str]:
-        result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        elig: List[str] = []
-        for r, c in counts.items():
-            if (c >= 3) and self.IsRankInStraightRange(r):
-                elig.append(r)
-        elig = list(self.SortRanks(elig))
-        i = 0
-        while i < len(elig):
-            j = i
-            while (j + 1 < len(elig)) and (self.RANK_TO_VAL[elig[j + 1]] == self.RANK_TO_VAL[elig[j]] + 1):
-                j = j + 1
-            block_len = j - i + 1
-            if block_len >= 2:
-                for L in range(2, block_len + 1):
-                    for start in range(i, j - L + 2):
-                        s = ""
-                        for t in range(start, start + L):
-                            s = s + elig[t] + elig[t] + elig[t]
-                        result.append(s)
-            i = j + 1
-        return self.SortUnique(result)
+    def FindPairChains(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("pair_chain", counts))
+        return self.FindChains(counts, 2, 3)
 
-    def FindAirplanesWithAttachments(self, hand_cards) -> Sequence[str]:
+    def FindAirplanes(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("airplane", counts))
+        return self.FindChains(counts, 3, 2)
+
+    def FindAirplanesWithAttachments(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("airplane_wings", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
         cores = self.FindAirplaneCores(counts)
         for core_ranks in cores:
             k = len(core_ranks)
             core_str = self.RepeatRanks(core_ranks, 3)
             remain = self.SubCounts(counts, self.MakeUseMap(core_ranks, 3))
-            single_slots = k
-            single_candidates = self.ListSingleRanksFromCounts(remain)
-            for pick in self.CombinationsByIndex(single_candidates, single_slots):
-                attach_cnt: Dict[str, int] = {}
-                for idx in pick:
-                    r = single_candidates[idx]
-                    attach_cnt[r] = attach_cnt.get(r, 0) + 1
-                if (attach_cnt.get("B", 0) == 1) and (attach_cnt.get("R", 0) == 1):
-                    continue
-                if not self.IsValidAirplaneAttachmentCounts(core_ranks, attach_cnt, "single"):
-                    continue
-                attach_str = self.StringFromCounts(attach_cnt)
-                result.append(core_str + attach_str)
-            pair_slots = k
-            pair_candidates = self.ListPairRanksFromCounts(remain)
-            for pick in self.CombinationsByIndex(pair_candidates, pair_slots):
-                attach_cnt: Dict[str, int] = {}
-                for idx in pick:
-                    r = pair_candidates[idx]
-                    attach_cnt[r] = attach_cnt.get(r, 0) + 2
-                if not self.IsValidAirplaneAttachmentCounts(core_ranks, attach_cnt, "pair"):
-                    continue
-                attach_str = self.StringFromCounts(attach_cnt)
-                result.append(core_str + attach_str)
+            limits = self.AirplaneAttachmentLimits(core_ranks, remain)
+            for unit in (1, 2):
+                picks, skipped = self.EnumerateAttachments(remain, limits, k, unit, unit == 1)
+                self.skipped_attachments = self.skipped_attachments + skipped
+                for attach_cnt in picks:
+                    result.append(core_str + self.StringFromCounts(attach_cnt))
         return self.SortUnique(result)
 
-    def FindFourWithTwo(self, hand_cards) -> Sequence[str]:
+    def FindFourWithTwo(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("four_two", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 4:
+        for i in range(0, len(counts)):
+            if counts[i] >= 4:
+                r = self.RANK_ORDER[i]
                 core_str = r + r + r + r
                 remain = self.CloneCounts(counts)
-                remain[r] = remain.get(r, 0) - 4
-                singles = self.ListSingleRanksFromCounts(remain)
-                for pick in self.CombinationsByIndex(singles, 2):
-                    rank1 = singles[pick[0]]
-                    rank2 = singles[pick[1]]
-                    if ((rank1 == "B" and rank2 == "R") or (rank1 == "R" and rank2 == "B")):
-                        continue
-                    s = core_str + rank1 + rank2
-                    result.append(s)
-                pairs = self.ListPairRanksFromCounts(remain)
-                for pick in self.CombinationsByIndex(pairs, 2):
-                    rankA = pairs[pick[0]]
-                    rankB = pairs[pick[1]]
-                    if rankA == rankB:
-                        continue
-                    s = core_str + rankA + rankA + rankB + rankB
-                    result.append(s)
+                remain[i] -= 4
+                for limits, unit in ((remain, 1), ([2 if c >= 2 else 0 for c in remain], 2)):
+                    picks, skipped = self.EnumerateAttachments(remain, limits, 2, unit, unit == 1)
+                    self.skipped_attachments = self.skipped_attachments + skipped
+                    for attach_cnt in picks:
+                        result.append(core_str + self.StringFromCounts(attach_cnt))
         return self.SortUnique(result)
 
-    def FindBombs(self, hand_cards) -> Sequence[str]:
+    def FindBombs(self, counts: Sequence[int]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.FitRows("bomb", counts))
         result: List[str] = []
-        counts = self.CountRanks(hand_cards)
-        for r, c in counts.items():
-            if c >= 4 and r != "B" and r != "R":
+        for i in range(0, len(counts)):
+            r = self.RANK_ORDER[i]
+            if counts[i] >= 4 and r != "B" and r != "R":
                 result.append(r + r + r + r)
         return self.SortUnique(result)
 
-    def FilterHigherBombs(self, hand_cards, last_bomb_value: int) -> Sequence[str]:
-        bombs = self.FindBombs(hand_cards)
+    def FilterHigherBombs(self, counts: Sequence[int], last_bomb_value: int) -> Sequence[str]:
+        bombs = self.FindBombs(counts)
         out: List[str] = []
         for b in bombs:
             r = b[0]
@@ -912,81 +1514,82 @@ class ActionGenerator:
                 out.append(b)
         return self.SortUnique(out)
 
-    def HasRocket(self, hand_cards) -> bool:
-        counts = self.CountRanks(hand_cards)
-        return (counts.get("B", 0) >= 1) and (counts.get("R", 0) >= 1)
+    def HasRocket(self, counts: Sequence[int]) -> bool:
+        return (counts[self.RANK_TO_VAL["B"]] >= 1) and (counts[self.RANK_TO_VAL["R"]] >= 1)
 
-    def FindSamePatternStronger(self, hand_cards, last_info: Dict[str, Any]) -> Sequence[str]:
+    def FindSamePatternStronger(self, counts: Sequence[int], last_info: Mapping[str, Any]) -> Sequence[str]:
+        if self.action_table is not None:
+            return self.SortUnique(self.action_table.StrongerRows(last_info, counts))
         out: List[str] = []
         kind = last_info["kind"]
         if kind == "solo":
-            candidates = self.FindSolos(hand_cards)
+            candidates = self.FindSolos(counts)
             for s in candidates:
                 val = self.RANK_TO_VAL[s[0]]
                 if val > last_info["main_value"]:
                     out.append(s)
         elif kind == "pair":
-            candidates = self.FindPairs(hand_cards)
+            candidates = self.FindPairs(counts)
             for s in candidates:
                 val = self.RANK_TO_VAL[s[0]]
                 if val > last_info["main_value"]:
                     out.append(s)
         elif kind == "trio":
-            candidates = self.FindTrios(hand_cards)
+            candidates = self.FindTrios(counts)
             for s in candidates:
                 trio_rank = s[0]
                 if self.RANK_TO_VAL[trio_rank] > last_info["main_value"]:
                     out.append(s)
         elif kind == "trio_single":
-            candidates = self.FindTrioWithSingle(hand_cards)
+            candidates = self.FindTrioWithSingle(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "trio_single") and (info.get("core_count") == last_info.get("core_count")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "trio_pair":
-            candidates = self.FindTrioWithPair(hand_cards)
+            candidates = self.FindTrioWithPair(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "trio_pair") and (info.get("core_count") == last_info.get("core_count")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "straight":
-            candidates = self.FindStraights(hand_cards)
+            candidates = self.FindStraights(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "straight") and (info.get("length") == last_info.get("length")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "pair_chain":
-            candidates = self.FindPairChains(hand_cards)
+            candidates = self.FindPairChains(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "pair_chain") and (info.get("pair_len") == last_info.get("pair_len")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "airplane":
-            candidates = self.FindAirplanes(hand_cards)
+            candidates = self.FindAirplanes(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "airplane") and (info.get("trio_len") == last_info.get("trio_len")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "airplane_single":
-            candidates = self.FindAirplanesWithAttachments(hand_cards)
+            candidates = self.FindAirplanesWithAttachments(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "airplane_single") and (info.get("trio_len") == last_info.get("trio_len")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "airplane_pair":
-            candidates = self.FindAirplanesWithAttachments(hand_cards)
+            candidates = self.FindAirplanesWithAttachments(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "airplane_pair") and (info.get("trio_len") == last_info.get("trio_len")) and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "four_two_single":
-            candidates = self.FindFourWithTwo(hand_cards)
+            candidates = self.FindFourWithTwo(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "four_two_single") and (info["main_value"] > last_info["main_value"]):
                     out.append(s)
         elif kind == "four_two_pair":
-            candidates = self.FindFourWithTwo(hand_cards)
+            candidates = self.FindFourWithTwo(counts)
             for s in candidates:
                 info = self.IdentifyPatternFromString(s)
                 if (info["kind"] == "four_two_pair") and (info["main_value"] > last_info["main_value"]):
@@ -997,80 +1600,263 @@ class ActionGenerator:
             pass
         return self.SortUnique(out)
 
-    def GenerateAllPatterns(self, hand_cards) -> Sequence[str]:
+    def CacheStats(self) -> Dict[str, Dict[str, int]]:
+        stats: Dict[str, Dict[str, int]] = {}
+        if self.lead_cache is not None:
+            stats["lead"] = self.lead_cache.Stats()
+        if self.response_cache is not None:
+            stats["response"] = self.response_cache.Stats()
+        return stats
+
+    def IterAllPatterns(self, counts: Sequence[int]) -> Iterator[str]:
+        generators = (self.FindSolos, self.FindPairs, self.FindTrios, self.FindTrioWithSingle, self.FindTrioWithPair,
+                      self.FindStraights, self.FindPairChains, self.FindAirplanes, self.FindAirplanesWithAttachments,
+                      self.FindFourWithTwo, self.FindBombs)
+        for generate in generators:
+            for s in generate(counts):
+                yield s
+        if self.HasRocket(counts):
+            yield "BR"
+
+    def GenerateAllPatterns(self, counts: Sequence[int]) -> Tuple[str, ...]:
+        key = tuple(counts)
+        if self.lead_cache is not None:
+            cached = self.lead_cache.Get(key)
+            if cached is not None:
+                return cached
+        result = tuple(self.SortUnique(list(self.IterAllPatterns(counts))))
+        if self.lead_cache is not None:
+            self.lead_cache.Put(key, result)
+        return result
+
+    def BuildSortKeys(self, table: ActionTable) -> List[Tuple[int, int, Tuple[int, ...]]]:
+        if table.sort_keys is None:
+            table.sort_keys = [self.ActionSortKey(a) for a in table.actions]
+        return table.sort_keys
+
+    def TrackedLeadPatterns(self, player, counts: Sequence[int]) -> Sequence[str]:
+        # Each player's fitting rows are kept as (sort key, row id) in SortUnique order, plus
+        # the ids whose strings do not identify. Playing cards only lowers counts, so a lead
+        # just drops the kept rows that need more of a lowered rank; the order of the rest
+        # is unchanged. A raised count (a new deal, added cards, an undo) rebuilds the list.
+        table = self.action_table
+        sort_keys = self.BuildSortKeys(table)
+        tracked = self.tracked_patterns.get(player)
+        raised = True
+        if tracked is not None:
+            prev_counts, entries, invalid = tracked
+            raised = any(counts[i] > prev_counts[i] for i in range(0, len(counts)))
+        if raised:
+            entries = sorted((sort_keys[action_id], action_id) for action_id in table.FitRowIds(counts))
+            invalid = set(action_id for key, action_id in entries if key[1] < 0)
+        else:
+            lowered = [(i, counts[i]) for i in range(0, len(counts)) if counts[i] < prev_counts[i]]
+            if lowered:
+                requirements = table.requirements
+                entries = [entry for entry in entries if all(requirements[entry[1]][i] <= c for i, c in lowered)]
+                invalid = set(action_id for action_id in invalid if all(requirements[action_id][i] <= c for i, c in lowered))
+        self.tracked_patterns[player] = (tuple(counts), entries, invalid)
+        if not invalid:
+            result = [table.actions[action_id] for _, action_id in entries]
+        else:
+            result = self.TrackedMixedOrder(table, entries, invalid)
+        if self.verify_incremental:
+            expected = list(self.GenerateAllPatterns(counts))
+            if expected != result:
+                raise RuntimeError("incremental lead patterns diverged for player " + str(player.GetId()))
+        return result
+
+    def TrackedMixedOrder(self, table: ActionTable, entries: List[Tuple[Any, int]], invalid: set) -> List[str]:
+        # A length group holding an unidentified string is ordered the way GenerateAllPatterns
+        # orders it: per-family SortUnique in row order, then SortMixedGroups over the group.
+        mixed_lengths = set(len(table.actions[action_id]) for action_id in invalid)
         result: List[str] = []
-        solos = self.FindSolos(hand_cards)
-        for s in solos:
-            result.append(s)
-        pairs = self.FindPairs(hand_cards)
-        for s in pairs:
-            result.append(s)
-        trios = self.FindTrios(hand_cards)
-        for s in trios:
-            result.append(s)
-        trio_single = self.FindTrioWithSingle(hand_cards)
-        for s in trio_single:
-            result.append(s)
-        trio_pair = self.FindTrioWithPair(hand_cards)
-        for s in trio_pair:
-            result.append(s)
-        straights = self.FindStraights(hand_cards)
-        for s in straights:
-            result.append(s)
-        pair_chains = self.FindPairChains(hand_cards)
-        for s in pair_chains:
-            result.append(s)
-        airplanes = self.FindAirplanes(hand_cards)
-        for s in airplanes:
-            result.append(s)
-        airplane_wings = self.FindAirplanesWithAttachments(hand_cards)
-        for s in airplane_wings:
-            result.append(s)
-        four_two = self.FindFourWithTwo(hand_cards)
-        for s in four_two:
-            result.append(s)
-        bombs = self.FindBombs(hand_cards)
-        for s in bombs:
-            result.append(s)
-        if self.HasRocket(hand_cards):
-            result.append("BR")
-        return self.SortUnique(result)
+        for length, group in itertools.groupby(entries, key=lambda entry: entry[0][0]):
+            if length not in mixed_lengths:
+                result.extend(table.actions[action_id] for _, action_id in group)
+                continue
+            by_family: Dict[str, List[str]] = {family: [] for family in ACTION_FAMILIES}
+            for action_id in sorted(action_id for _, action_id in group):
+                by_family[table.families[action_id]].append(table.actions[action_id])
+            keyed: List[Tuple[Tuple[int, int, Tuple[int, ...]], str]] = []
+            for family in ACTION_FAMILIES:
+                for s in self.SortUnique(by_family[family]):
+                    keyed.append((table.sort_keys[table.action_to_id[s]], s))
+            result.extend(self.SortMixedGroups(keyed))
+        return result
+
+    def ResetTrackedPatterns(self) -> None:
+        self.tracked_patterns = weakref.WeakKeyDictionary()
+
+    # Yields the same actions as GetLegalActions without sorting the whole list. When leading,
+    # the order is family by family (solos, pairs, trios, trio+single, trio+pair, straights,
+    # pair chains, airplanes, airplanes with wings, four-with-two, bombs, rocket), each family in
+    # SortUnique order. When following, "pass" comes first, then the stronger plays of the same
+    # pattern, then the bombs that beat the last play, then the rocket.
+    def IterLegalActions(self, player, round_context) -> Iterator[str]:
+        counts = self.CountRanks(player.GetHandView())
+        last = round_context.GetLastValidPlay()
+        if (last is None) or (last[0] == player.GetId()):
+            for s in self.IterAllPatterns(counts):
+                yield s
+            return
+        yield "pass"
+        last_info = round_context.GetLastValidPattern(self.IdentifyPatternFromString)
+        if last_info["kind"] == "invalid":
+            for s in self.IterAllPatterns(counts):
+                yield s
+            return
+        if last_info["kind"] == "rocket":
+            return
+        for s in self.FindSamePatternStronger(counts, last_info):
+            yield s
+        if last_info["kind"] != "bomb":
+            bombs = self.FindBombs(counts)
+        else:
+            bombs = self.FilterHigherBombs(counts, last_info["main_value"])
+        for b in bombs:
+            yield b
+        if self.HasRocket(counts):
+            yield "BR"
+
+    def AnyLegalNonPass(self, player, round_context) -> bool:
+        for s in self.IterLegalActions(player, round_context):
+            if s != "pass":
+                return True
+        return False
+
+    def CountLegalActions(self, player, round_context) -> int:
+        n = 0
+        for _ in self.IterLegalActions(player, round_context):
+            n = n + 1
+        return n
+
+    def SampleLegalAction(self, player, round_context, rng: Optional[random.Random] = None) -> str:
+        if rng is None:
+            rng = random.Random()
+        chosen = "pass"
+        n = 0
+        for s in self.IterLegalActions(player, round_context):
+            n = n + 1
+            if rng.randrange(n) == 0:
+                chosen = s
+        return chosen
+
+    def LongestLegalAction(self, player, round_context) -> str:
+        longest: List[str] = []
+        for s in self.IterLegalActions(player, round_context):
+            if s == "pass":
+                continue
+            if (not longest) or (len(s) > len(longest[0])):
+                longest = [s]
+            elif len(s) == len(longest[0]):
+                longest.append(s)
+        if not longest:
+            return "pass"
+        return self.SortUnique(longest)[0]
 
     def GetLegalActions(self, player, round_context) -> Sequence[str]:
-        actions: List[str] = []
-        hand_cards = player.GetHand()
+        counts = self.CountRanks(player.GetHandView())
         last = round_context.GetLastValidPlay()
         if (last is None) or (last[0] == player.GetId()):
-            all_patterns = self.GenerateAllPatterns(hand_cards)
-            for s in all_patterns:
-                actions.append(s)
-            return self.SortUnique(actions)
-        actions.append("pass")
-        last_str = last[1]
-        last_info = self.IdentifyPatternFromString(last_str)
+            if self.incremental_patterns:
+                return self.TrackedLeadPatterns(player, counts)
+            return list(self.GenerateAllPatterns(counts))
+        return self.GenerateResponses(counts, last[1], round_context.GetLastValidPattern(self.IdentifyPatternFromString))
+
+    def GenerateResponses(self, counts: Sequence[int], last_str: str, last_info: Optional[Mapping[str, Any]] = None) -> Sequence[str]:
+        key = None
+        if self.response_cache is not None:
+            key = (tuple(counts), self.NormalizeActionString(last_str))
+            cached = self.response_cache.Get(key)
+            if cached is not None:
+                return list(cached)
+        actions: List[str] = ["pass"]
+        if last_info is None:
+            last_info = self.IdentifyPatternFromString(last_str)
         if last_info["kind"] == "invalid":
-            all_patterns = self.GenerateAllPatterns(hand_cards)
+            all_patterns = self.GenerateAllPatterns(counts)
             for s in all_patterns:
                 actions.append(s)
-            return self.SortUnique(actions)
-        if last_info["kind"] == "rocket":
-            return self.SortUnique(actions)
-        stronger = self.FindSamePatternStronger(hand_cards, last_info)
-        for s in stronger:
-            actions.append(s)
-        if last_info["kind"] != "bomb":
-            bombs = self.FindBombs(hand_cards)
-            for b in bombs:
-                actions.append(b)
+        elif last_info["kind"] != "rocket":
+            stronger = self.FindSamePatternStronger(counts, last_info)
+            for s in stronger:
+                actions.append(s)
+            if last_info["kind"] != "bomb":
+                bombs = self.FindBombs(counts)
+                for b in bombs:
+                    actions.append(b)
+            else:
+                higher_bombs = self.FilterHigherBombs(counts, last_info["main_value"])
+                for b in higher_bombs:
+                    actions.append(b)
+            if self.HasRocket(counts):
+                actions.append("BR")
+        result = list(self.SortUnique(actions))
+        if self.response_cache is not None:
+            self.response_cache.Put(key, tuple(result))
+        return result
+
+    def BuildActionTable(self) -> ActionTable:
+        deck = [1 if (r == "B" or r == "R") else 4 for r in self.RANK_ORDER]
+        rows: List[Tuple[str, str, List[int]]] = []
+        for i in range(0, len(deck)):
+            r = self.RANK_ORDER[i]
+            rows.append((r, "solo", self.MakeUseMap([r], 1)))
+            if deck[i] < 4:
+                continue
+            rows.append((r + r, "pair", self.MakeUseMap([r], 2)))
+            rows.append((r + r + r, "trio", self.MakeUseMap([r], 3)))
+            rows.append((r + r + r + r, "bomb", self.MakeUseMap([r], 4)))
+            trio_use = self.MakeUseMap([r], 3)
+            for j in range(0, len(deck)):
+                if j != i:
+                    rows.append((r + r + r + self.RANK_ORDER[j], "trio_single", trio_use))
+                if j != i and deck[j] >= 2:
+                    rows.append((r + r + r + self.RANK_ORDER[j] * 2, "trio_pair", trio_use))
+            four_use = self.MakeUseMap([r], 4)
+            remain = self.SubCounts(deck, four_use)
+            for limits, unit in ((remain, 1), ([2 if c >= 2 else 0 for c in remain], 2)):
+                for attach_cnt in self.EnumerateAttachments(remain, limits, 2, unit, unit == 1)[0]:
+                    rows.append((r * 4 + self.StringFromCounts(attach_cnt), "four_two", four_use))
+        rows.append(("BR", "rocket", self.MakeUseMap(["B", "R"], 1)))
+        for family, width, min_len in (("straight", 1, 5), ("pair_chain", 2, 3), ("airplane", 3, 2)):
+            for s in self.FindChains(deck, width, min_len):
+                rows.append((s, family, self.CountRanksFromString(s)))
+        for core_ranks in self.FindAirplaneCores(deck):
+            k = len(core_ranks)
+            core_str = self.RepeatRanks(core_ranks, 3)
+            core_use = self.MakeUseMap(core_ranks, 3)
+            remain = self.SubCounts(deck, core_use)
+            limits = self.AirplaneAttachmentLimits(core_ranks, remain)
+            for unit in (1, 2):
+                if len(core_str) + unit * k > MAX_HAND_SIZE:
+                    continue
+                for attach_cnt in self.EnumerateAttachments(remain, limits, k, unit, unit == 1)[0]:
+                    rows.append((core_str + self.StringFromCounts(attach_cnt), "airplane_wings", core_use))
+        rows.sort(key=lambda row: (len(row[0]), [self.RANK_TO_VAL[ch] for ch in row[0]]))
+        table = ActionTable()
+        for action_str, family, core in rows:
+            if len(action_str) > MAX_HAND_SIZE or action_str in table.action_to_id:
+                continue
+            info = self.IdentifyPatternFromStringSlow(action_str)
+            table.AddRow(action_str, family, info, self.CountRanksFromString(action_str), core)
+        return table
+
+SHARED_ACTION_TABLE: Optional[ActionTable] = None
+
+def GetSharedActionTable(ag: ActionGenerator, path: Optional[str] = None) -> ActionTable:
+    global SHARED_ACTION_TABLE
+    if SHARED_ACTION_TABLE is None:
+        if (path is not None) and os.path.exists(path):
+            SHARED_ACTION_TABLE = LoadActionTable(path)
         else:
-            higher_bombs = self.FilterHigherBombs(hand_cards, last_info["main_value"])
-            for b in higher_bombs:
-                actions.append(b)
-        if self.HasRocket(hand_cards):
-            actions.append("BR")
-        return self.SortUnique(actions)
-
-def NewActionGenerator() -> ActionGenerator:
+            SHARED_ACTION_TABLE = ag.BuildActionTable()
+            if path is not None:
+                SaveActionTable(SHARED_ACTION_TABLE, path)
+    return SHARED_ACTION_TABLE
+
+def NewActionGenerator(use_action_table: bool = False, action_table_path: Optional[str] = None, use_pattern_lookup: bool = False, lead_cache_size: int = 0, response_cache_size: int = 0, incremental_patterns: bool = False, verify_incremental: bool = False) -> ActionGenerator:
     ag = ActionGenerator()
     ag.RANK_ORDER = ["3","4","5","6","7","8","9","T","J","Q","K","A","2","B","R"]
     ag.RANK_TO_VAL = {}
@@ -1078,15 +1864,89 @@ def NewActionGenerator() -> ActionGenerator:
         ag.RANK_TO_VAL[ag.RANK_ORDER[i]] = i
     ag.MAX_STRAIGHT_RANK = "A"
     ag.MIN_STRAIGHT_RANK = "3"
+    if use_action_table or (action_table_path is not None) or incremental_patterns:
+        ag.action_table = GetSharedActionTable(ag, action_table_path)
+    ag.incremental_patterns = incremental_patterns
+    ag.verify_incremental = verify_incremental
+    if use_pattern_lookup:
+        ag.pattern_lookup = ag.BuildPatternIndex(GetSharedActionTable(ag, action_table_path))
+    if lead_cache_size > 0:
+        ag.lead_cache = ActionCache(lead_cache_size)
+    if response_cache_size > 0:
+        ag.response_cache = ActionCache(response_cache_size)
     return ag
+
+BATCH_CACHE_SIZE = 4096
+
+def NewBatchActionGenerator() -> ActionGenerator:
+    # Settings for drivers that play many games on one shared generator.
+    return NewActionGenerator(use_action_table=True, lead_cache_size=BATCH_CACHE_SIZE, response_cache_size=BATCH_CACHE_SIZE)
 @@ FILE: doudizhu/Game.py @@
 from__future__ import annotations
-from typing import Dict, List, Any, Sequence, Optional
-from doudizhu.Player import NewPlayer, Player
+import time
+from typing import Dict, List, Any, NamedTuple, Sequence, Optional, Tuple, Union
+from doudizhu.base import CARDS, NUM_CARDS, RANKS, Card
+from doudizhu.Player import NewCountHandPlayer, NewPlayer, Player
 from doudizhu.Dealer import NewDealer, Dealer
 from doudizhu.Judger import NewJudger, Judger
 from doudizhu.Round import NewRound, Round
-from doudizhu.ActionGenerator import NewActionGenerator
+from doudizhu.ActionGenerator import ActionGenerator, GetSharedActionTable, NewActionGenerator
+
+class GameState(NamedTuple):
+    # Hashable snapshot of a game in progress. Each hand is a 54-bit mask over card ids,
+    # or a tuple of 15 rank counts when it holds suitless cards (see EncodeHand). The
+    # landlord's bonus cards keep their dealt order, as BuildState shows them unsorted.
+    hands: Tuple[Union[int, Tuple[int, ...]], ...]
+    landlord_id: Optional[int]
+    seen_ids: Tuple[int, ...]
+    last_valid_play: Optional[Tuple[int, str]]
+    consecutive_passes: int
+    current_player_id: Optional[int]
+    played_counts: Tuple[int, ...]
+
+MAX_TURNS = 163
+
+class GameResult(NamedTuple):
+    winner_id: int
+    payoff: Dict[int, int]
+    landlord_id: Optional[int]
+    turns: int
+    trace_ids: Tuple[int, ...]
+
+class SimulationReport(NamedTuple):
+    results: List[GameResult]
+    elapsed: float
+    games_per_sec: float
+
+def MaskToHand(mask: int) -> List:
+    # Card ids follow hand sort order, so the result is already sorted.
+    hand = []
+    while mask:
+        low = mask & -mask
+        hand.append(CARDS[low.bit_length() - 1])
+        mask ^= low
+    return hand
+
+def EncodeHand(cards) -> Union[int, Tuple[int, ...]]:
+    # Suited hands encode as a card-id mask. A CountHandPlayer without suits
+    # holds placeholder cards, so its hand encodes as rank counts instead.
+    mask = 0
+    for c in cards:
+        if c.id >= NUM_CARDS:
+            counts = [0] * len(RANKS)
+            for card in cards:
+                counts[card.rank_index] += 1
+            return tuple(counts)
+        mask |= 1 << c.id
+    return mask
+
+def DecodeHand(encoded: Union[int, Tuple[int, ...]]) -> List:
+    if isinstance(encoded, int):
+        return MaskToHand(encoded)
+    hand = []
+    for i in range(0, len(RANKS)):
+        hand.extend([Card(rank=RANKS[i], suit=None)] * encoded[i])
+    return hand
 
 class Game:
     def __init__(self) -> None:
@@ -1097,6 +1957,13 @@ class Game:
         self.seen_cards = []
         self.action_generator = None
         self.landlord_id: Optional[int] = None
+        self.current_player_id: Optional[int] = None
+        self.env_obs: Dict[str, Any] = {}
+        self.env_legal_by_id: Dict[int, str] = {}
+        self.env_hand_sizes: List[int] = []
+        self.env_remaining: List[int] = []
+        self.env_turns: int = 0
+        self.env_done: bool = True
 
     def GetOthersHandAsString(self, exclude_player_id: int) -> str:
         combined = ""
@@ -1116,7 +1983,7 @@ class Game:
         current_hand = self.players[current_player_id].GetHandAsString()
         others_hand = self.GetOthersHandAsString(current_player_id)
         trace = self.round.GetActionTrace()
-        played_cards = self.round.GetAllPlayedCards()
+        played_cards = self.round.GetPlayedCardsAsString()
         seen_str = ""
         for c in seen_cards:
             seen_str = seen_str + c.rank
@@ -1132,6 +1999,40 @@ class Game:
         }
         return state
 
+    def ApplyAction(self, player_id: int, action) -> Tuple:
+        round_token = self.round.RecordActionUndoable(player_id, action)
+        hand_token = self.players[player_id].RemoveCardsUndoable(action)
+        token = (player_id, round_token, hand_token, self.current_player_id)
+        self.current_player_id = self.round.GetNextPlayer(player_id)
+        return token
+
+    def UndoAction(self, token: Tuple) -> None:
+        player_id, round_token, hand_token, current_player_id = token
+        self.players[player_id].UndoRemoveCards(hand_token)
+        self.round.UndoAction(round_token)
+        self.current_player_id = current_player_id
+
+    def ToState(self) -> GameState:
+        return GameState(
+            tuple(EncodeHand(p.GetHandView()) for p in self.players),
+            self.landlord_id,
+            tuple(c.id for c in self.seen_cards),
+            self.round.last_valid_play,
+            self.round.consecutive_passes,
+            self.current_player_id,
+            tuple(self.round.played_counts))
+
+    def FromState(self, state: GameState) -> None:
+        # Loads a snapshot into this game, reusing its players and round. The
+        # action trace and undo history start empty from the loaded position.
+        for p, encoded in zip(self.players, state.hands):
+            p.SetHand(DecodeHand(encoded))
+            p.SetRole("landlord" if p.GetId() == state.landlord_id else "peasant")
+        self.landlord_id = state.landlord_id
+        self.seen_cards = [CARDS[i] for i in state.seen_ids]
+        self.current_player_id = state.current_player_id
+        self.round.LoadPosition(state.played_counts, state.last_valid_play, state.consecutive_passes)
+
     def DisplayResults(self, winner_id: int, payoff: Dict[int, int]) -> None:
         if winner_id == -1:
             print("No winner determined.")
@@ -1149,23 +2050,34 @@ class Game:
             print(entry)
         return
 
-def NewGame() -> Game:
+def NewGame(count_hands: bool = False, seed: Optional[int] = None, use_global_random: bool = False,
+            action_generator: Optional[ActionGenerator] = None) -> Game:
     game = Game()
-    game.players = [ NewPlayer(0),
-                     NewPlayer(1),
-                     NewPlayer(2) ]
-    game.dealer = NewDealer()
+    if count_hands:
+        game.players = [ NewCountHandPlayer(0),
+                         NewCountHandPlayer(1),
+                         NewCountHandPlayer(2) ]
+    else:
+        game.players = [ NewPlayer(0),
+                         NewPlayer(1),
+                         NewPlayer(2) ]
+    game.dealer = NewDealer(seed=seed, use_global_random=use_global_random)
     game.judger = NewJudger()
     game.round = NewRound(game.players, game.judger)
     game.seen_cards = []
-    game.action_generator = NewActionGenerator()
+    if action_generator is None:
+        action_generator = NewActionGenerator()
+    game.action_generator = action_generator
     game.landlord_id = None
+    game.current_player_id = None
     return game
 
 class Game(Game):  # Extend with Run under the same class name per constraints
-    def Run(self) -> None:
-        deck = self.dealer.ShuffleDeck()
-        (hands, seen_cards) = self.dealer.Deal(deck)
+    def StartGame(self, deal_index: Optional[int] = None) -> int:
+        if deal_index is None:
+            (hands, seen_cards) = self.dealer.NextDeal()
+        else:
+            (hands, seen_cards) = self.dealer.DealAt(deal_index)
         self.seen_cards = seen_cards
         for i in range(0, 3):
             self.players[i].SetHand(hands[i])
@@ -1177,12 +2089,21 @@ class Game(Game):  # Extend with Run under the same class name per constraints
                 self.players[i].SetRole("landlord")
             else:
                 self.players[i].SetRole("peasant")
-        current_player_id = landlord_id
+        self.round.Reset()
+        self.current_player_id = landlord_id
+        return landlord_id
+
+    def PlayTurns(self, verbose: bool = True) -> Tuple[int, int]:
+        landlord_id = self.landlord_id
+        seen_cards = self.seen_cards
+        current_player_id = self.current_player_id
         turn_count = 0
-        max_turns = 163
-        while not self.judger.IsGameOver(self.players):
+        max_turns = MAX_TURNS
+        hand_sizes = [p.HandSize() for p in self.players]
+        while not self.judger.IsGameOverBySizes(hand_sizes):
             if turn_count >= max_turns:
-                print("Reached max turns, aborting game loop.")
+                if verbose:
+                    print("Reached max turns, aborting game loop.")
                 break
             current_player = self.players[current_player_id]
             legal_actions = self.action_generator.GetLegalActions(current_player, self.round)
@@ -1198,16 +2119,316 @@ class Game(Game):  # Extend with Run under the same class name per constraints
                     is_legal = True
                     break
             if not is_legal:
-                print("Warning: Player", current_player_id, "returned an illegal action. Choosing a valid fallback.")
+                if verbose:
+                    print("Warning: Player", current_player_id, "returned an illegal action. Choosing a valid fallback.")
                 fallback_action_str = state["actions"][0]
-                action = Player.ParseActionStringToCards(self.players[current_player_id], fallback_action_str)
+                action = self.players[current_player_id].ParseActionStringToCards(fallback_action_str)
             self.round.RecordAction(current_player_id, action)
             self.players[current_player_id].RemoveCards(action)
-            if self.judger.IsGameOver(self.players):
+            hand_sizes[current_player_id] = self.players[current_player_id].HandSize()
+            if self.judger.IsGameOverBySizes(hand_sizes):
                 break
             current_player_id = self.round.GetNextPlayer(current_player_id)
+            self.current_player_id = current_player_id
             turn_count = turn_count + 1
         winner_id = self.judger.GetWinner(self.players)
+        return (winner_id, turn_count)
+
+    def Play(self, deal_index: Optional[int] = None) -> GameResult:
+        self.StartGame(deal_index)
+        (winner_id, _) = self.PlayTurns(verbose=False)
+        payoff = self.judger.CalculatePayoff(winner_id, self.landlord_id)  # type: ignore
+        trace_ids = tuple(self.action_generator.GetActionId(action_str) for _, action_str in self.round.action_trace)
+        # turns counts every recorded play, the winning one included.
+        return GameResult(winner_id, payoff, self.landlord_id, len(trace_ids), trace_ids)
+
+    def Run(self) -> None:
+        self.StartGame()
+        (winner_id, _) = self.PlayTurns(verbose=True)
         payoff = self.judger.CalculatePayoff(winner_id, self.landlord_id)  # type: ignore
         self.DisplayResults(winner_id, payoff)
         return
+
+    # Environment-style driver. reset() deals a new game and step() applies one
+    # action id for the player to move. The observation dict is kept up to date
+    # from the round's cached counts, strings and trace views instead of being
+    # rebuilt by BuildState; each call returns a shallow copy of it.
+    def reset(self, seed: Optional[int] = None, deal_index: Optional[int] = None) -> Tuple[Dict[str, Any], List[int]]:
+        if seed is not None:
+            self.dealer.Reseed(seed)
+        self.StartGame(deal_index)
+        self.env_turns = 0
+        self.env_done = False
+        self.env_hand_sizes = [p.HandSize() for p in self.players]
+        self.env_remaining = [0] * len(RANKS)
+        for p in self.players:
+            for i, n in enumerate(p.GetRankCounts()):
+                self.env_remaining[i] += n
+        self.env_obs = {
+            "landlord": self.landlord_id,
+            "seen_cards": "".join(c.rank for c in self.seen_cards),
+        }
+        legal_ids = self.UpdateObservation()
+        return (dict(self.env_obs), legal_ids)
+
+    def step(self, action_id: int) -> Tuple[Dict[str, Any], List[int], Dict[int, int], bool]:
+        if self.env_done:
+            raise RuntimeError("step() called on a finished game; call reset() first")
+        action_str = self.env_legal_by_id.get(action_id)
+        if action_str is None:
+            raise ValueError("Action id " + str(action_id) + " is not legal for player " + str(self.current_player_id))
+        player_id = self.current_player_id
+        player = self.players[player_id]
+        action = player.ParseActionStringToCards(action_str)
+        self.round.RecordAction(player_id, action)
+        player.RemoveCards(action)
+        for c in action:
+            self.env_remaining[c.rank_index] -= 1
+        self.env_hand_sizes[player_id] = player.HandSize()
+        self.env_turns = self.env_turns + 1
+        done = self.judger.IsGameOverBySizes(self.env_hand_sizes) or (self.env_turns >= MAX_TURNS)
+        if done:
+            self.env_done = True
+            winner_id = self.judger.GetWinner(self.players)
+            reward = self.judger.CalculatePayoff(winner_id, self.landlord_id)  # type: ignore
+            legal_ids = self.UpdateObservation()
+        else:
+            reward = {p.GetId(): 0 for p in self.players}
+            self.current_player_id = self.round.GetNextPlayer(player_id)
+            legal_ids = self.UpdateObservation()
+        return (dict(self.env_obs), legal_ids, reward, done)
+
+    def UpdateObservation(self) -> List[int]:
+        player_id = self.current_player_id
+        player = self.players[player_id]
+        if self.env_done:
+            legal_actions: Sequence[str] = []
+        else:
+            legal_actions = self.action_generator.GetLegalActions(player, self.round)
+        legal_ids = [self.action_generator.GetActionId(a) for a in legal_actions]
+        self.env_legal_by_id = dict(zip(legal_ids, legal_actions))
+        counts = player.GetRankCounts()
+        obs = self.env_obs
+        obs["self"] = player_id
+        obs["current_hand"] = player.GetHandAsString()
+        obs["others_hand"] = "".join(RANKS[i] * (self.env_remaining[i] - counts[i]) for i in range(0, len(RANKS)))
+        obs["actions"] = legal_actions
+        obs["action_ids"] = legal_ids
+        obs["trace"] = self.round.GetActionTrace()
+        obs["played_cards"] = self.round.GetPlayedCardsAsString()
+        obs["played_counts"] = self.round.GetPlayedCounts()
+        obs["hand_sizes"] = tuple(self.env_hand_sizes)
+        return legal_ids
+
+def SimulateMany(n: int, seed: Optional[int] = None, game: Optional[Game] = None) -> SimulationReport:
+    # Plays n quiet games back to back on one Game, reusing its players, round and generator.
+    if game is None:
+        game = NewGame()
+    if seed is not None:
+        game.dealer.Reseed(seed)
+    # Build the shared action table up front so its one-off cost stays out of the timing.
+    if game.action_generator.action_table is None:
+        GetSharedActionTable(game.action_generator)
+    results: List[GameResult] = []
+    start = time.perf_counter()
+    for _ in range(0, n):
+        results.append(game.Play())
+    elapsed = time.perf_counter() - start
+    games_per_sec = (n / elapsed) if elapsed > 0 else 0.0
+    return SimulationReport(results, elapsed, games_per_sec)
+@@ FILE: doudizhu/VectorGame.py @@
+from__future__ import annotations
+from typing import List, Optional, Tuple
+import numpy as np
+from doudizhu.base import RANKS
+from doudizhu.Game import Game, NewGame
+from doudizhu.ActionGenerator import ActionGenerator, GetSharedActionTable, NewBatchActionGenerator
+
+NUM_RANKS = len(RANKS)
+NUM_SEATS = 3
+# Per-table observation row: current hand, other hands, played cards and last
+# valid play as rank counts, then hand sizes by seat, one-hot current seat,
+# one-hot landlord seat and the consecutive pass count.
+OBS_SIZE = 4 * NUM_RANKS + 3 * NUM_SEATS + 1
+
+def EncodeObservation(game: Game, out: np.ndarray) -> None:
+    player = game.players[game.current_player_id]
+    counts = player.GetRankCounts()
+    remaining = game.env_remaining
+    out[:] = 0
+    out[0:NUM_RANKS] = counts
+    out[NUM_RANKS:2 * NUM_RANKS] = [remaining[i] - counts[i] for i in range(0, NUM_RANKS)]
+    out[2 * NUM_RANKS:3 * NUM_RANKS] = game.round.played_counts
+    last = game.round.GetLastValidPlay()
+    if last is not None:
+        out[3 * NUM_RANKS:4 * NUM_RANKS] = game.action_generator.CountRanksFromString(last[1])
+    base = 4 * NUM_RANKS
+    out[base:base + NUM_SEATS] = game.env_hand_sizes
+    out[base + NUM_SEATS + game.current_player_id] = 1
+    out[base + 2 * NUM_SEATS + game.landlord_id] = 1
+    out[base + 3 * NUM_SEATS] = game.round.consecutive_passes
+
+class VectorGame:
+    # Steps N independent games in lockstep. Observations come back as an
+    # (N, OBS_SIZE) int8 array and legal actions as an (N, table size) bool
+    # mask indexed by action-table id. A table whose game ends is reset at once,
+    # so the returned row already belongs to the next game; its final payoff is
+    # in that step's rewards.
+    def __init__(self) -> None:
+        self.games: List[Game] = []
+        self.action_generator: Optional[ActionGenerator] = None
+        self.seed: Optional[int] = None
+        self.deals: int = 0
+        self.obs: np.ndarray = np.zeros((0, OBS_SIZE), dtype=np.int8)
+        self.masks: np.ndarray = np.zeros((0, 0), dtype=bool)
+        self.legal_ids: List[List[int]] = []
+        self.episode_counts: List[int] = []
+
+    def NumGames(self) -> int:
+        return len(self.games)
+
+    def NextDealIndex(self) -> Optional[int]:
+        if self.seed is None:
+            return None
+        deal_index = self.deals
+        self.deals = self.deals + 1
+        return deal_index
+
+    def ResetGame(self, i: int) -> None:
+        (_, ids) = self.games[i].reset(deal_index=self.NextDealIndex())
+        self.episode_counts[i] = self.episode_counts[i] + 1
+        self.SetLegal(i, ids)
+        EncodeObservation(self.games[i], self.obs[i])
+
+    def SetLegal(self, i: int, ids: List[int]) -> None:
+        self.masks[i, self.legal_ids[i]] = False
+        self.masks[i, ids] = True
+        self.legal_ids[i] = ids
+
+    def reset(self) -> Tuple[np.ndarray, np.ndarray]:
+        self.deals = 0
+        for i in range(0, len(self.games)):
+            self.ResetGame(i)
+        return (self.obs.copy(), self.masks.copy())
+
+    def step(self, actions) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        n = len(self.games)
+        if len(actions) != n:
+            raise ValueError("Expected " + str(n) + " actions, got " + str(len(actions)))
+        rewards = np.zeros((n, NUM_SEATS), dtype=np.float32)
+        dones = np.zeros(n, dtype=bool)
+        for i in range(0, n):
+            game = self.games[i]
+            (_, ids, reward, done) = game.step(int(actions[i]))
+            if done:
+                for seat in range(0, NUM_SEATS):
+                    rewards[i, seat] = reward[seat]
+                dones[i] = True
+                self.ResetGame(i)
+            else:
+                self.SetLegal(i, ids)
+                EncodeObservation(game, self.obs[i])
+        return (self.obs.copy(), self.masks.copy(), rewards, dones)
+
+def NewVectorGame(num_games: int, seed: Optional[int] = None, count_hands: bool = False,
+                  action_generator: Optional[ActionGenerator] = None) -> VectorGame:
+    vector = VectorGame()
+    if action_generator is None:
+        action_generator = NewBatchActionGenerator()
+    vector.action_generator = action_generator
+    for _ in range(0, num_games):
+        vector.games.append(NewGame(count_hands=count_hands, seed=seed, action_generator=action_generator))
+    vector.seed = seed
+    vector.deals = 0
+    vector.obs = np.zeros((num_games, OBS_SIZE), dtype=np.int8)
+    table = action_generator.action_table
+    if table is None:
+        table = GetSharedActionTable(action_generator)
+    vector.masks = np.zeros((num_games, table.Size()), dtype=bool)
+    vector.legal_ids = [[] for _ in range(0, num_games)]
+    vector.episode_counts = [0] * num_games
+    return vector
+@@ FILE: doudizhu/SelfPlay.py @@
+from__future__ import annotations
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from doudizhu.Game import Game, GameResult, NewGame
+from doudizhu.ActionGenerator import NewBatchActionGenerator
+
+# Game i of a run is always dealt by Dealer.DealAt(i) for the run's seed, so
+# results do not depend on how many workers there are or which one plays a
+# chunk, and match SimulateMany(num_games, seed).
+
+class SelfPlayChunk(NamedTuple):
+    start: int
+    results: List[GameResult]
+    worker_pid: int
+    elapsed: float
+
+class WorkerStats(NamedTuple):
+    games: int
+    busy_seconds: float
+    games_per_sec: float
+
+class SelfPlayReport(NamedTuple):
+    results: List[GameResult]
+    elapsed: float
+    games_per_sec: float
+    worker_stats: Dict[int, WorkerStats]
+
+WORKER_GAMES: Dict[bool, Game] = {}
+
+def GetWorkerGame(count_hands: bool) -> Game:
+    # One Game per worker process, reused for every chunk that worker plays.
+    game = WORKER_GAMES.get(count_hands)
+    if game is None:
+        game = NewGame(count_hands=count_hands, action_generator=NewBatchActionGenerator())
+        WORKER_GAMES[count_hands] = game
+    return game
+
+def PlayChunk(seed: int, start: int, stop: int, count_hands: bool = False) -> SelfPlayChunk:
+    game = GetWorkerGame(count_hands)
+    game.dealer.Reseed(seed)
+    begin = time.perf_counter()
+    results: List[GameResult] = []
+    for index in range(start, stop):
+        results.append(game.Play(index))
+    return SelfPlayChunk(start, results, os.getpid(), time.perf_counter() - begin)
+
+def IterSelfPlay(num_games: int, seed: int = 0, workers: Optional[int] = None,
+                 chunk_size: int = 256, count_hands: bool = False) -> Iterator[SelfPlayChunk]:
+    # Yields chunks as they finish, which is not necessarily in index order.
+    # workers <= 1 plays every chunk in this process.
+    bounds = [(start, min(start + chunk_size, num_games)) for start in range(0, num_games, chunk_size)]
+    if (workers is not None) and (workers <= 1):
+        for start, stop in bounds:
+            yield PlayChunk(seed, start, stop, count_hands)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(PlayChunk, seed, start, stop, count_hands) for start, stop in bounds]
+        for future in as_completed(futures):
+            yield future.result()
+
+def RunSelfPlay(num_games: int, seed: int = 0, workers: Optional[int] = None,
+                chunk_size: int = 256, count_hands: bool = False) -> SelfPlayReport:
+    begin = time.perf_counter()
+    chunks: List[SelfPlayChunk] = []
+    for chunk in IterSelfPlay(num_games, seed, workers, chunk_size, count_hands):
+        chunks.append(chunk)
+    elapsed = time.perf_counter() - begin
+    chunks.sort(key=lambda chunk: chunk.start)
+    results: List[GameResult] = []
+    games_by_worker: Dict[int, int] = {}
+    busy_by_worker: Dict[int, float] = {}
+    for chunk in chunks:
+        results.extend(chunk.results)
+        games_by_worker[chunk.worker_pid] = games_by_worker.get(chunk.worker_pid, 0) + len(chunk.results)
+        busy_by_worker[chunk.worker_pid] = busy_by_worker.get(chunk.worker_pid, 0.0) + chunk.elapsed
+    worker_stats: Dict[int, WorkerStats] = {}
+    for pid, games in games_by_worker.items():
+        busy = busy_by_worker[pid]
+        worker_stats[pid] = WorkerStats(games, busy, (games / busy) if busy > 0 else 0.0)
+    games_per_sec = (num_games / elapsed) if elapsed > 0 else 0.0
+    return SelfPlayReport(results, elapsed, games_per_sec, worker_stats)